@@ -5,13 +5,18 @@ This module is intended to serve as a wrapper for AWS functionalities in order t
 """
 
 # import packages
-import boto3
 from io import StringIO, BytesIO
 import pandas as pd
 import json
-import botocore
-import pyarrow.parquet as pq
 import io
+from dtype_plan import as_plan
+from instrumentation import instrumented, record
+from lazy_import import lazy_module
+
+# heavy backends, imported on first use
+boto3 = lazy_module("boto3")
+botocore_exceptions = lazy_module("botocore.exceptions")
+pq = lazy_module("pyarrow.parquet")
 
 # class to ease operation of s3
 class S3:
@@ -77,12 +82,14 @@ class S3:
         
         return multi_objects
     
-    def multi_read(self, multi_objects, bucket_name = None):
+    @instrumented
+    def multi_read(self, multi_objects, bucket_name = None, dtypes = None):
         
         """
         Params:
             multi_objects: (s3 object list) agglomeration of s3 objects, or list of filenames
             bucket_name: (string) name of bucket of operation, option to specify at instantiation or within method
+            dtypes: (True, dict or DtypePlan) optional dtype plan applied to every file, see dtype_plan
             
         Returns:
             If successful, writes dataframe with specified file location and name to s3 as csv
@@ -96,43 +103,37 @@ class S3:
             
             bucket_name = self.bucket_name
         
-        # build dataset concatenating temp objects
-        df = pd.DataFrame()
-        
+        # isolate object names, based on s3 object list or list of object names
         if type(multi_objects) != list:
+            keys = [thing.key for thing in multi_objects.all()]
+        else:
+            keys = [str(thing) for thing in multi_objects]
+        
+        # read each object and concatenate once at the end
+        frames = []
+        
+        for key in keys:
             
-            # based on s3 object list
-            for thing in multi_objects.all():
-                
-
-                
-                if thing.key.endswith(".csv"): # need to change this, not getting picked up
-                    df = self.read_csv(path = thing.key, bucket_name = bucket_name)
-                    print("---")
-                    print(f"Read {thing.key}")
-                    df = df.append(df)
-                    print(f"Appended {thing.key}")                
-                elif (thing.key.endswith(".parquet")) | (thing.key.endswith(".pq"))  | (thing.key.endswith(".parquet.snappy")):
-                    df = self.read_parquet(path = thing.key, bucket_name = bucket_name)
-                    print("---")
-                    print(f"Read {thing.key}")
-                    df = df.append(df)
-                    print(f"Appended {thing.key}")
-                
-        elif type(multi_objects) == list:
+            if key.endswith(".csv"):
+                frames.append(self.read_csv(path = key, bucket_name = bucket_name, dtypes = dtypes))
+            elif (key.endswith(".parquet")) | (key.endswith(".pq"))  | (key.endswith(".parquet.snappy")):
+                frames.append(self.read_parquet(path = key, bucket_name = bucket_name, dtypes = dtypes))
+            else:
+                continue
             
-            # based on list of object names
-            for thing in multi_objects.all():
-                
-                if str(thing).endswith(".csv"):
-                    df = self.read_csv(path = thing, bucket_name = bucket_name)
-                elif (str(thing).endswith(".parquet")) | (str(thing).endswith(".pq"))  | (str(thing).endswith(".parquet.snappy")):
-                    df = self.read_parquet(path = thing, bucket_name = bucket_name)
-                    
-                df = df.append(df)
+            print("---")
+            print(f"Read {key}")
+        
+        # build dataset concatenating temp objects
+        if len(frames) == 0:
+            return pd.DataFrame()
+        
+        plan = as_plan(dtypes)
+        df = plan.concat(frames) if plan != None else pd.concat(frames, ignore_index = True)
             
         return df
                 
+    @instrumented
     def write_csv(self, df, object_name, path, bucket_name = None, feedback = None):
         
         """
@@ -158,18 +159,22 @@ class S3:
             # create csv buffer and write pandas df to location
             csv_buffer = StringIO()
             df.to_csv(csv_buffer, index = False)
-            self.resource.Object(bucket_name, f"{path}{str(object_name).split('.')[0]}.csv").put(Body=csv_buffer.getvalue())
+            body = csv_buffer.getvalue()
+            self.resource.Object(bucket_name, f"{path}{str(object_name).split('.')[0]}.csv").put(Body=body)
+            record(rows = len(df), bytes = len(body), requests = 1)
             
             # create optional feedback, default to yes
             if feedback != False:
                 print(f"Successfuly Wrote {str(object_name)} within bucket {bucket_name} to {path} ")
         
-    def read_csv(self, path, bucket_name = None):
+    @instrumented
+    def read_csv(self, path, bucket_name = None, dtypes = None):
         
         """
         Params:
             path: (string) destination filepath and entire filename specified within s3 bucket
             bucket_name: (string) name of bucket of operation, option to specify at instantiation or within method
+            dtypes: (True, dict or DtypePlan) optional dtype plan for compact columns, see dtype_plan
             
         Returns:
             If successful, reads data from s3 and returns pandas dataframe into memory
@@ -184,14 +189,17 @@ class S3:
         # ingest object from S3
         obj = self.resource.Object(bucket_name, path)
         body = obj.get()['Body'].read()
+        record(bytes = len(body), requests = 1)
 
         # byte to dataframe
         s = str(body,'utf-8')
         data = StringIO(s) 
-        df = pd.read_csv(data)
+        plan = as_plan(dtypes)
+        df = plan.read_csv(data) if plan != None else pd.read_csv(data)
         
         return df
     
+    @instrumented
     def write_dict(self, d, object_name, path, bucket_name = None, feedback = None):
         
         """
@@ -215,12 +223,15 @@ class S3:
             bucket_name = self.bucket_name
             
             # create csv buffer and write pandas df to location
-            self.resource.Object(bucket_name, f"{path}{str(object_name).split('.')[0]}.dict").put(Body=json.dumps(d))
+            body = json.dumps(d)
+            self.resource.Object(bucket_name, f"{path}{str(object_name).split('.')[0]}.dict").put(Body=body)
+            record(bytes = len(body), requests = 1)
             
             # create optional feedback, default to yes
             if feedback != False:
                 print(f"Successfuly Wrote {str(object_name)} within bucket {bucket_name} to {path} ")
     
+    @instrumented
     def read_dict(self, path, bucket_name = None):
         
         """
@@ -241,12 +252,14 @@ class S3:
         # ingest object from S3
         obj = self.resource.Object(bucket_name, path)
         body = obj.get()['Body'].read().decode('utf-8')
+        record(bytes = len(body), requests = 1)
 
         # byte to dict
         d = json.loads(body)
         
         return d
 
+    @instrumented
     def write_parquet(self, df, object_name, path, bucket_name = None, feedback = None):
         
         """
@@ -273,17 +286,20 @@ class S3:
             out_buffer = BytesIO()
             df.to_parquet(out_buffer, index=False)
             self.resource.Object(bucket_name, f"{path}{str(object_name).split('.')[0]}.parquet").put(Body=out_buffer.getvalue())
+            record(rows = len(df), bytes = out_buffer.getbuffer().nbytes, requests = 1)
             
             # create optional feedback, default to yes
             if feedback != False:
                 print(f"Successfuly Wrote {str(object_name)} within bucket {bucket_name} to {path} ")
             
-    def read_parquet(self, path, bucket_name = None):
+    @instrumented
+    def read_parquet(self, path, bucket_name = None, dtypes = None):
         
         """
         Params:
             path: (string) destination filepath and entire filename specified within s3 bucket
             bucket_name: (string) name of bucket of operation, option to specify at instantiation or within method
+            dtypes: (True, dict or DtypePlan) optional dtype plan for compact columns, see dtype_plan
             
         Returns:
             If successful, reads data from s3 and returns pandas dataframe into memory
@@ -299,8 +315,10 @@ class S3:
         buffer = io.BytesIO()
         obj = self.resource.Object(bucket_name, path)
         obj.download_fileobj(buffer)
+        record(bytes = buffer.getbuffer().nbytes, requests = 1)
         table = pq.read_table(buffer)
-        df = table.to_pandas()
+        plan = as_plan(dtypes)
+        df = plan.from_arrow(table) if plan != None else table.to_pandas()
         
         return df
     
@@ -325,6 +343,7 @@ class S3:
         
         return bucket, obj
     
+    @instrumented
     def get_list(self, s3_path):
         
         """
@@ -344,6 +363,7 @@ class S3:
         # ingest object from S3
         obj = self.resource.Object(bucket, obj_path)
         body = obj.get()['Body'].read()
+        record(bytes = len(body), requests = 1)
         
         # byte to text to list
         s = str(body,'utf-8')
@@ -351,6 +371,7 @@ class S3:
         
         return l
     
+    @instrumented
     def create_file(self, file_path, bucket_name = None):
         
         # flexible bucket options (on instantiation or within method)
@@ -360,9 +381,11 @@ class S3:
             print("Please Choose Bucket Name to Continue")
         
         self.client.put_object(Bucket=bucket_name, Key=file_path)
+        record(requests = 1)
         
         print(f"Created {file_path}")
         
+    @instrumented
     def obj_check(self, s3_path):
         
         """
@@ -376,8 +399,9 @@ class S3:
         bucket, obj_path = self.parse_path(s3_path)
         
         try:
+            record(requests = 1)
             self.resource.Object(bucket, obj_path).load()
-        except botocore.exceptions.ClientError as e:
+        except botocore_exceptions.ClientError as e:
             if e.response["Error"]["Code"] == 404:
                 return False
             else:
@@ -385,6 +409,7 @@ class S3:
         else:
             return True
         
+    @instrumented
     def crawl_size(self, prefix):
         
         """
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-ins for the remote services the helpers talk to, so every hot path can be benchmarked offline.
+
+    S3          -> moto in-process mock (same boto3 request path, no network)
+    Snowflake   -> SQLite engine swapped into snowflake_etl.client
+    MSSQL       -> SQLite engine/connection swapped into mssql_etl.client
+    SQL source  -> in-memory read_batches over a prepared frame, for transfer_etl
+    Smartsheet  -> in-memory sheets api with injected latency
+    Google Maps -> googlemaps.Client look-alike with injected latency
+"""
+
+import contextlib
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def sample_frame(rows, seed = 0):
+
+    """
+    Builds a mixed-type dataframe shaped like our usual extracts
+    """
+
+    rng = np.random.default_rng(seed)
+
+    return pd.DataFrame({"id": np.arange(rows),
+                         "region": rng.choice(["east", "west", "north", "south"], rows),
+                         "status": rng.choice(["open", "closed"], rows),
+                         "amount": rng.normal(100, 25, rows).round(2),
+                         "count": rng.integers(0, 1000, rows),
+                         "latitude": rng.uniform(25, 49, rows),
+                         "longitude": rng.uniform(-124, -67, rows),
+                         "created": pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 10**6, rows), unit = "s")})
+
+
+@contextlib.contextmanager
+def fake_s3(bucket_name = "bench-bucket"):
+
+    """
+    Yields an aws_etl.S3 pointed at a moto mocked bucket
+    """
+
+    from moto import mock_aws
+    import aws_etl
+
+    # moto refuses to run against real looking credentials
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+    with mock_aws():
+
+        s3 = aws_etl.S3(secret = "testing", access_id = "testing", bucket_name = bucket_name, region = "us-east-1")
+        s3.client.create_bucket(Bucket = bucket_name)
+
+        yield s3
+
+
+def sqlite_engine(path):
+
+    """
+    File backed SQLite engine standing in for Snowflake/MSSQL
+    """
+
+    from sqlalchemy import create_engine
+
+    return create_engine(f"sqlite:///{path}")
+
+
+def fake_snowflake(path):
+
+    """
+    snowflake_etl.client backed by SQLite, skips the snowflake URL/authenticator setup
+    """
+
+    import snowflake_etl
+
+    client = snowflake_etl.client.__new__(snowflake_etl.client)
+    client.account, client.username, client.authenticator = "bench", "bench", "bench"
+    client.warehouse, client.database, client.schema = "bench", "bench", None
+    client.engine = sqlite_engine(path)
+
+    return client
+
+
+def fake_mssql(path):
+
+    """
+    mssql_etl.client backed by SQLite, skips the pymssql connection string
+    """
+
+    import mssql_etl
+
+    client = mssql_etl.client.__new__(mssql_etl.client)
+    client.engine = sqlite_engine(path)
+    client.connection = client.engine.connect()
+    client.database, client.host, client.port = "main", "localhost", "0"
+
+    return client
+
+
+class FakeSQLSource:
+
+    def __init__(self, df):
+
+        """
+        SQL client look-alike for transfer_etl.transfer, read_batches slices a prepared frame the way a cursor would
+
+        Params:
+            df: (dataframe object) full query result
+        """
+
+        self.df = df
+
+    def read_batches(self, query, batch_size = 100000):
+
+        for start in range(0, len(self.df), batch_size):
+            # typed per batch like pandas.read_sql chunks, an all NULL column comes out as object
+            yield self.df.iloc[start:start + batch_size].reset_index(drop = True).infer_objects()
+
+
+def sparse_frame(rows, null_rows, seed = 0):
+
+    """
+    sample_frame plus numeric and timestamp columns that stay NULL for the first null_rows rows, like a late filled closed_at
+    """
+
+    df = sample_frame(rows, seed)
+    late = np.arange(rows) >= null_rows
+
+    return df.assign(score = np.where(late, df["amount"] / 10, None),
+                     closed_at = df["created"].astype(object).where(late, None))
+
+
+class FakeSheet:
+
+    def __init__(self, sheet_id, name, columns):
+
+        self.id = sheet_id
+        self.name = name
+        self.columns = columns
+        self.rows = []
+
+    def make_cells(self, values):
+
+        return [{"column": k, "value": v} for k, v in values.items()]
+
+
+class FakeResult:
+
+    def __init__(self, obj):
+
+        self.obj = obj
+
+
+class FakeSheets:
+
+    def __init__(self, latency = 0.0):
+
+        """
+        In-memory sheets api covering the calls made by smartsheet_etl.ss_client.tl_ss
+
+        Params:
+            latency: (float) seconds slept per api call
+        """
+
+        self.latency = latency
+        self.sheets = {}
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def _hit(self):
+
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.latency)
+
+    def list(self):
+
+        self._hit()
+        return list(self.sheets.values())
+
+    def delete(self, id):
+
+        self._hit()
+        self.sheets = {k: v for k, v in self.sheets.items() if v.id != id}
+
+    def create(self, skeleton):
+
+        self._hit()
+        sheet = FakeSheet(len(self.sheets) + 1, skeleton.name, skeleton.columns)
+        self.sheets[sheet.name] = sheet
+        return FakeResult(sheet)
+
+    def get(self, name = None, id = None):
+
+        self._hit()
+        if id != None:
+            return [x for x in self.sheets.values() if x.id == id][0]
+        return self.sheets[name]
+
+    def add_rows(self, sheet_id, rows):
+
+        self._hit()
+        sheet = [x for x in self.sheets.values() if x.id == sheet_id][0]
+        sheet.rows.extend(rows)
+
+    def sort_rows(self, sheet, order):
+
+        self._hit()
+        return sheet
+
+
+class FakeSmartsheet:
+
+    def __init__(self, latency = 0.0):
+
+        self.sheets = FakeSheets(latency)
+
+
+@contextlib.contextmanager
+def fake_smartsheet(latency = 0.0):
+
+    """
+    Yields an smartsheet_etl.ss_client whose api calls hit FakeSheets
+
+    tl_ss reaches for both self.smart.sheets and the module level smartsheet name,
+    so both are pointed at the same fake for the duration of the benchmark.
+    """
+
+    import smartsheet_etl
+
+    fake = FakeSmartsheet(latency)
+    client = smartsheet_etl.ss_client.__new__(smartsheet_etl.ss_client)
+    client.smart = fake
+
+    original = smartsheet_etl.smartsheet
+    smartsheet_etl.smartsheet = fake
+
+    try:
+        yield client
+    finally:
+        smartsheet_etl.smartsheet = original
+
+
+class FakeGMapsClient:
+
+    def __init__(self, latency = 0.05):
+
+        """
+        googlemaps.Client look-alike returning canned payloads after a fixed delay
+
+        Params:
+            latency: (float) seconds slept per request, roughly a real round trip
+        """
+
+        self.latency = latency
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def _hit(self):
+
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.latency)
+
+    def reverse_geocode(self, latlng):
+
+        self._hit()
+        lat, lng = latlng
+
+        return [{"formatted_address": f"{rank} Main St",
+                 "place_id": f"{lat:.5f},{lng:.5f},{rank}",
+                 "address_components": [{"long_name": "Main St", "types": ["route"]}],
+                 "plus_code": {"compound_code": "ABCD+EF Town", "global_code": "87G7ABCD+EF"},
+                 "geometry": {"location": {"lat": lat, "lng": lng}, "location_type": "ROOFTOP"},
+                 "types": ["street_address"] if rank == 0 else ["route", "locality", "political"]}
+                for rank in range(0, 3)]
+
+    def places_nearby(self, location = None, radius = None, open_now = None, page_token = None):
+
+        self._hit()
+        lat, lng = [float(x) for x in (location or "0,0").split(",")]
+
+        return {"results": [{"name": f"place {rank}",
+                             "place_id": f"{lat:.5f},{lng:.5f},{rank}",
+                             "geometry": {"location": {"lat": lat, "lng": lng}},
+                             "types": ["store", "point_of_interest"] if rank else ["restaurant", "food"]}
+                            for rank in range(0, 5)]}
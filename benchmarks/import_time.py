@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Import-time budget check for the helper modules.
+
+Each module is imported in a fresh interpreter with pandas/numpy preloaded (every helper needs them),
+so the measured time is what the helper itself adds on a cold start. Fails if a module exceeds its
+budget or eagerly pulls in one of the heavy backends.
+
+Usage (from the repository root):
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget-ms 50 --output benchmarks/results/import_time.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+MODULES = ["aws_etl", "snowflake_etl", "mssql_etl", "smartsheet_etl", "geo_etl", "transfer_etl",
+           "checkpoint", "dtype_plan", "instrumentation", "lazy_import"]
+
+# backends that must only load on first use
+BACKENDS = ["boto3", "botocore", "pyarrow.parquet", "sqlalchemy", "snowflake.sqlalchemy", "pymssql",
+            "smartsheet", "simple_smartsheet", "googlemaps", "sklearn", "pyspark"]
+
+PROBE = """
+import pandas, numpy
+import {module}
+import sys, json
+print(json.dumps([x for x in {backends!r} if x in sys.modules]))
+"""
+
+
+def measure(module):
+
+    """
+    Returns (import microseconds on top of pandas/numpy, eagerly loaded backends) for one module
+    """
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    probe = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE.format(module = module, backends = BACKENDS)],
+                           capture_output = True, text = True, cwd = root)
+
+    if probe.returncode != 0:
+        raise RuntimeError(probe.stderr.strip().splitlines()[-1])
+
+    # importtime lines look like "import time:  self | cumulative | name", top level imports are unindented
+    micros = 0
+    for line in probe.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].rstrip() == f" {module}":
+            micros = int(parts[1])
+
+    return micros, json.loads(probe.stdout.strip().splitlines()[-1])
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs = "+", default = MODULES)
+    parser.add_argument("--budget-ms", type = float, default = 50, help = "allowed import time per module on top of pandas/numpy")
+    parser.add_argument("--output", default = None)
+    args = parser.parse_args(argv)
+
+    results = []
+    failures = 0
+
+    for module in args.modules:
+
+        try:
+            micros, loaded = measure(module)
+        except RuntimeError as e:
+            print(f"{module:<18}  error: {e}")
+            results.append({"module": module, "error": str(e)})
+            failures += 1
+            continue
+
+        over = micros / 1000 > args.budget_ms
+        failures += over or len(loaded) > 0
+
+        print(f"{module:<18}{micros / 1000:>9.1f}ms" + ("  over budget" if over else "") + (f"  eager: {', '.join(loaded)}" if loaded else ""))
+        results.append({"module": module, "import_ms": micros / 1000, "budget_ms": args.budget_ms, "eager_backends": loaded})
+
+    if args.output != None:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok = True)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent = 2)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
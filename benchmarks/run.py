@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline benchmark suite for the helper hot paths.
+
+Every case runs against the local stand-ins in benchmarks/fakes.py and records latency percentiles,
+throughput and peak memory per data size. Each case and size runs in a fresh interpreter, so the resident memory high-water
+mark belongs to that case alone. Results are written as json so runs of different versions can be compared.
+
+Usage (from the repository root):
+    python -m benchmarks.run --sizes 1000 10000 100000 --output benchmarks/results/current.json
+    python -m benchmarks.run --compare benchmarks/results/baseline.json benchmarks/results/current.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks import fakes
+
+
+##### Benchmark cases
+# each case is a context manager taking a data size and yielding (callable, units processed per call)
+
+@contextlib.contextmanager
+def case_s3_multi_read(size):
+
+    # spread rows over files of 10k rows
+    with fakes.fake_s3() as s3:
+
+        df = fakes.sample_frame(size)
+        for i, start in enumerate(range(0, size, 10000)):
+            s3.write_parquet(df.iloc[start:start + 10000], f"part_{i:04d}", "bench/multi/", feedback = False)
+
+        objects = s3.multi_file_filter("bench/multi/")
+
+        yield (lambda: s3.multi_read(objects)), size
+
+
+@contextlib.contextmanager
+def case_s3_read_parquet(size):
+
+    with fakes.fake_s3() as s3:
+
+        s3.write_parquet(fakes.sample_frame(size), "frame", "bench/", feedback = False)
+
+        yield (lambda: s3.read_parquet("bench/frame.parquet")), size
+
+
+@contextlib.contextmanager
+def case_s3_write_csv(size):
+
+    with fakes.fake_s3() as s3:
+
+        df = fakes.sample_frame(size)
+
+        yield (lambda: s3.write_csv(df, "frame", "bench/", feedback = False)), size
+
+
+@contextlib.contextmanager
+def case_s3_crawl_size(size):
+
+    # one object per 100 rows, nested two levels deep
+    with fakes.fake_s3() as s3:
+
+        objects = max(1, size // 100)
+        for i in range(0, objects):
+            s3.client.put_object(Bucket = s3.bucket_name, Key = f"bench/crawl/{i % 10}/obj_{i}.csv", Body = b"a,b\n1,2\n")
+
+        yield (lambda: s3.crawl_size("bench/crawl/")), objects
+
+
+@contextlib.contextmanager
+def case_snowflake_append(size):
+
+    with tempfile.TemporaryDirectory() as tmp:
+
+        client = fakes.fake_snowflake(os.path.join(tmp, "snowflake.db"))
+        df = fakes.sample_frame(size)
+
+        yield (lambda: client.append(df, "bench_append")), size
+
+        client.engine.dispose()
+
+
+@contextlib.contextmanager
+def case_mssql_to_sql(size):
+
+    with tempfile.TemporaryDirectory() as tmp:
+
+        client = fakes.fake_mssql(os.path.join(tmp, "mssql.db"))
+        df = fakes.sample_frame(size)
+
+        yield (lambda: client.to_sql(df, "bench_to_sql", None, "append")), size
+
+        client.close_conn()
+        client.engine.dispose()
+
+
+@contextlib.contextmanager
+def case_smartsheet_tl_ss(size):
+
+    with fakes.fake_smartsheet(latency = 0.01) as ss:
+
+        df = fakes.sample_frame(size)[["id", "region", "status", "amount"]]
+
+        yield (lambda: ss.tl_ss("bench", df, "id")), size
+
+
+@contextlib.contextmanager
+def case_gmaps_reverse_geocode(size):
+
+    import geo_etl
+
+    # api calls are the bottleneck, keep point counts realistic for a 50ms round trip
+    points = max(1, size // 100)
+    gmaps = geo_etl.GMaps(client = fakes.FakeGMapsClient(latency = 0.05), qps = 100)
+    df = fakes.sample_frame(points)
+
+    yield (lambda: gmaps.reverse_geocode(df, "latitude", "longitude")), points
+
+
+@contextlib.contextmanager
+def case_transfer_sql_to_s3(size):
+
+    import transfer_etl
+
+    # score/closed_at are NULL for the whole first batch, later values must still get through
+    batch_size = max(1, size // 4)
+    source = fakes.FakeSQLSource(fakes.sparse_frame(size, batch_size))
+
+    def func():
+        rows = transfer_etl.transfer("select * from bench", "bench/transfer.parquet", source, s3, batch_size = batch_size, feedback = False)
+        assert rows == size, f"transferred {rows} of {size} rows"
+
+    with fakes.fake_s3() as s3:
+
+        yield func, size
+
+
+CASES = {"s3.multi_read": case_s3_multi_read,
+         "s3.read_parquet": case_s3_read_parquet,
+         "s3.write_csv": case_s3_write_csv,
+         "s3.crawl_size": case_s3_crawl_size,
+         "snowflake.append": case_snowflake_append,
+         "mssql.to_sql": case_mssql_to_sql,
+         "smartsheet.tl_ss": case_smartsheet_tl_ss,
+         "gmaps.reverse_geocode": case_gmaps_reverse_geocode,
+         "transfer.sql_to_s3": case_transfer_sql_to_s3}
+
+
+##### Measurement
+
+# runs one measurement in a fresh interpreter, the record is the last line of stdout
+WORKER = """
+import json
+from benchmarks import run
+print(json.dumps(run.measure({name!r}, {size!r}, {repeat!r})))
+"""
+
+
+def max_rss_mb():
+
+    # linux reports kilobytes, macos bytes
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024
+
+
+def measure(name, size, repeat):
+
+    """
+    Runs one case at one size and summarizes timings and memory
+    """
+
+    record = {"case": name, "size": size, "repeat": repeat}
+
+    try:
+
+        # helpers print progress feedback, keep it out of the report
+        with contextlib.redirect_stdout(io.StringIO()), CASES[name](size) as (func, units):
+
+            # warm up caches and lazy imports outside of the measurement
+            func()
+
+            seconds = []
+            peaks = []
+
+            for i in range(0, repeat):
+
+                tracemalloc.start()
+                start = time.perf_counter()
+                func()
+                seconds.append(time.perf_counter() - start)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+
+        record.update({"units": units,
+                       "seconds": seconds,
+                       "p50_s": float(np.percentile(seconds, 50)),
+                       "p90_s": float(np.percentile(seconds, 90)),
+                       "p99_s": float(np.percentile(seconds, 99)),
+                       "throughput_per_s": units / float(np.median(seconds)),
+                       "peak_traced_mb": max(peaks) / 1024 ** 2,
+                       "max_rss_mb": max_rss_mb()})
+
+    except Exception as e:
+
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        record["error"] = f"{type(e).__name__}: {e}"
+
+    return record
+
+
+def isolated(name, size, repeat):
+
+    """
+    Runs measure in a subprocess, max_rss_mb is a per process lifetime peak and would otherwise carry over between cases
+    """
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    worker = subprocess.run([sys.executable, "-c", WORKER.format(name = name, size = size, repeat = repeat)],
+                            capture_output = True, text = True, cwd = root)
+
+    if worker.returncode != 0:
+        lines = worker.stderr.strip().splitlines()
+        return {"case": name, "size": size, "repeat": repeat, "error": lines[-1] if lines else f"exit code {worker.returncode}"}
+
+    return json.loads(worker.stdout.strip().splitlines()[-1])
+
+
+def metadata():
+
+    """
+    Environment details stored next to results so runs stay comparable
+    """
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output = True, text = True).stdout.strip()
+    except OSError:
+        commit = None
+
+    versions = {}
+    for package in ["pandas", "numpy", "pyarrow", "boto3", "sqlalchemy", "moto"]:
+        try:
+            versions[package] = __import__(package).__version__
+        except Exception:
+            versions[package] = None
+
+    return {"timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "versions": versions}
+
+
+def compare(baseline_path, current_path, threshold):
+
+    """
+    Prints p50 ratios between two result files, returns the number of regressions beyond threshold
+    """
+
+    with open(baseline_path) as f:
+        baseline = {(x["case"], x["size"]): x for x in json.load(f)["results"]}
+    with open(current_path) as f:
+        current = {(x["case"], x["size"]): x for x in json.load(f)["results"]}
+
+    regressions = 0
+
+    print(f"{'case':<24}{'size':>10}{'base p50':>12}{'curr p50':>12}{'ratio':>8}")
+
+    for key in sorted(set(baseline) & set(current)):
+
+        old, new = baseline[key], current[key]
+        if "error" in old or "error" in new:
+            print(f"{key[0]:<24}{key[1]:>10}{'error':>12}")
+            continue
+
+        ratio = new["p50_s"] / old["p50_s"]
+        flag = " !" if ratio > 1 + threshold else ""
+        regressions += flag != ""
+
+        print(f"{key[0]:<24}{key[1]:>10}{old['p50_s']:>12.4f}{new['p50_s']:>12.4f}{ratio:>8.2f}{flag}")
+
+    return regressions
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", nargs = "+", default = list(CASES), choices = list(CASES))
+    parser.add_argument("--sizes", nargs = "+", type = int, default = [1000, 10000, 100000])
+    parser.add_argument("--repeat", type = int, default = 5)
+    parser.add_argument("--output", default = os.path.join("benchmarks", "results", "current.json"))
+    parser.add_argument("--compare", nargs = 2, metavar = ("BASELINE", "CURRENT"))
+    parser.add_argument("--threshold", type = float, default = 0.10, help = "p50 slowdown ratio counted as a regression")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return 1 if compare(*args.compare, args.threshold) else 0
+
+    results = []
+
+    for name in args.cases:
+        for size in args.sizes:
+
+            record = isolated(name, size, args.repeat)
+            results.append(record)
+
+            if "error" in record:
+                print(f"{name:<24}{size:>10}  {record['error']}")
+            else:
+                print(f"{name:<24}{size:>10}  p50 {record['p50_s']:.4f}s  p99 {record['p99_s']:.4f}s  "
+                      f"{record['throughput_per_s']:,.0f}/s  peak {record['peak_traced_mb']:.1f}MB")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok = True)
+    with open(args.output, "w") as f:
+        json.dump({"meta": metadata(), "results": results}, f, indent = 2)
+
+    print(f"Wrote {args.output}")
+
+    # a failing case is a broken hot path, not just a missing number
+    return 1 if any("error" in x for x in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This module is intended to serve as a checkpointing batch runner for long, paid-per-call jobs (GMaps, Smartsheet).
+
+Input rows are split into fixed batches. Every completed batch is written to local parquet and recorded in a manifest,
+rows that failed are kept aside for a targeted retry, and a rerun against the same input resumes from the last checkpoint.
+
+Layout of a checkpoint directory:
+    manifest.json           input fingerprint, batch size, job parameters and the files written so far
+    batch_00000.parquet     results of batch 0
+    failed_00000.parquet    input rows of batch 0 that failed
+    retry_00000.parquet     results of the first retry of failed rows
+"""
+
+import hashlib
+import json
+import os
+import pandas as pd
+
+
+class CheckpointJob:
+
+    def __init__(self, path, batch_size = 1000):
+
+        """
+        Params:
+            path: (string) local directory holding the checkpoint, created if missing
+            batch_size: (int) input rows per batch
+        """
+
+        self.path = path
+        self.batch_size = batch_size
+        self.manifest_path = os.path.join(path, "manifest.json")
+        self.manifest = None
+
+    def _file(self, name):
+
+        return os.path.join(self.path, name)
+
+    def _save_manifest(self):
+
+        # write then rename so a crash never leaves a half written manifest
+        temp = self.manifest_path + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(self.manifest, f, indent = 2)
+        os.replace(temp, self.manifest_path)
+
+    def _write(self, df, name):
+
+        temp = self._file(name + ".tmp")
+        df.to_parquet(temp, index = False)
+        os.replace(temp, self._file(name))
+
+    @staticmethod
+    def fingerprint(df, key_cols):
+
+        """
+        Hash of the key columns, in order, identifying the input a checkpoint belongs to
+        """
+
+        hashes = pd.util.hash_pandas_object(df[key_cols], index = False).to_numpy()
+
+        return hashlib.sha1(hashes.tobytes()).hexdigest()
+
+    def start(self, df, key_cols, params = None, **extra):
+
+        """
+        Opens the checkpoint for this input, creating it if needed
+
+        Params:
+            df: (dataframe object) full job input
+            key_cols: (list) columns identifying a row
+            params: (dict) json serializable job parameters (method name, call arguments), must match on resume
+            extra: values stored in the manifest on creation (e.g. ids of created resources)
+
+        Returns:
+            True if an existing checkpoint is resumed, False if a new one was created
+        """
+
+        fingerprint = self.fingerprint(df, key_cols)
+
+        # normalized through json so it compares equal to the stored copy
+        params = json.loads(json.dumps(params or {}))
+
+        if os.path.exists(self.manifest_path):
+
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+            if self.manifest["fingerprint"] != fingerprint or self.manifest["batch_size"] != self.batch_size:
+                raise ValueError(f"Checkpoint at {self.path} was written for a different input or batch size, use a new path")
+
+            if self.manifest.get("params") != params:
+                raise ValueError(f"Checkpoint at {self.path} was written with parameters {self.manifest.get('params')}, not {params}, use a new path")
+
+            return True
+
+        os.makedirs(self.path, exist_ok = True)
+        self.manifest = {"fingerprint": fingerprint,
+                         "batch_size": self.batch_size,
+                         "params": params,
+                         "key_cols": list(key_cols),
+                         "rows": len(df),
+                         "batches": {},
+                         "results": [],
+                         "failed": [],
+                         "retries": 0,
+                         "extra": extra}
+        self._save_manifest()
+
+        return False
+
+    @property
+    def extra(self):
+
+        return self.manifest["extra"]
+
+    def update_extra(self, **extra):
+
+        """
+        Stores values in the manifest, e.g. a resource id only known after the job started
+        """
+
+        self.manifest["extra"].update(extra)
+        self._save_manifest()
+
+    def run(self, df, func, key_cols, params = None):
+
+        """
+        Runs func over every batch not yet checkpointed
+
+        Params:
+            df: (dataframe object) full job input, must be the same input on resume
+            func: (callable) takes a batch dataframe, returns (result dataframe, list of failed positions within the batch)
+            key_cols: (list) columns identifying a row
+            params: (dict) job parameters, must match the ones the checkpoint was written with
+
+        Returns:
+            pandas dataframe of all checkpointed results (see results)
+        """
+
+        if self.manifest == None:
+            self.start(df, key_cols, params = params)
+
+        done = 0
+
+        for b, start in enumerate(range(0, len(df), self.batch_size)):
+
+            name = f"{b:05d}"
+            if name in self.manifest["batches"]:
+                continue
+
+            batch = df.iloc[start:start + self.batch_size]
+            result, failed = func(batch)
+
+            # results first, manifest last, so a batch only counts once all of its files exist
+            self._write(result, f"batch_{name}.parquet")
+            self.manifest["results"].append(f"batch_{name}.parquet")
+
+            if len(failed) > 0:
+                self._write(batch.iloc[failed], f"failed_{name}.parquet")
+                self.manifest["failed"].append(f"failed_{name}.parquet")
+
+            self.manifest["batches"][name] = {"rows": len(batch), "failed": len(failed)}
+            self._save_manifest()
+            done += 1
+
+        print(f"--- Checkpoint {self.path}: ran {done} batches, {len(self.manifest['batches'])} complete, {len(self.failed())} rows failed")
+
+        return self.results()
+
+    def failed(self):
+
+        """
+        Returns:
+            pandas dataframe of the input rows still failed
+        """
+
+        if len(self.manifest["failed"]) == 0:
+            return pd.DataFrame()
+
+        return pd.concat([pd.read_parquet(self._file(x)) for x in self.manifest["failed"]], ignore_index = True)
+
+    def retry_failed(self, func):
+
+        """
+        Reruns func over the failed rows only, rows failing again stay recorded for a later retry
+
+        Params:
+            func: (callable) same contract as in run
+
+        Returns:
+            pandas dataframe of all checkpointed results (see results)
+        """
+
+        failed = self.failed()
+        if len(failed) == 0:
+            return self.results()
+
+        name = f"{self.manifest['retries']:05d}"
+        result, still = func(failed)
+
+        self._write(result, f"retry_{name}.parquet")
+        self.manifest["results"].append(f"retry_{name}.parquet")
+
+        old = self.manifest["failed"]
+        self.manifest["failed"] = []
+        if len(still) > 0:
+            self._write(failed.iloc[still], f"failed_retry_{name}.parquet")
+            self.manifest["failed"] = [f"failed_retry_{name}.parquet"]
+
+        self.manifest["retries"] += 1
+        self._save_manifest()
+
+        # old failure files are superseded once the manifest points elsewhere
+        for x in old:
+            if x not in self.manifest["failed"]:
+                os.remove(self._file(x))
+
+        print(f"--- Checkpoint {self.path}: retried {len(failed)} rows, {len(still)} still failed")
+
+        return self.results()
+
+    def results(self):
+
+        """
+        Returns:
+            pandas dataframe concatenating every checkpointed batch and retry result
+        """
+
+        frames = [pd.read_parquet(self._file(x)) for x in self.manifest["results"]]
+        frames = [x for x in frames if len(x.columns) > 0]
+
+        if len(frames) == 0:
+            return pd.DataFrame()
+
+        return pd.concat(frames, ignore_index = True)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This module is intended to serve as shared dtype planning for the helper readers, so wide extracts materialize compactly.
+
+A plan combines an optional explicit schema with sampling-based inference:
+    low-cardinality strings  -> category (parsed/decoded straight to categorical where the reader allows it)
+    integers                 -> smallest integer type holding the actual values
+    floats                   -> float32, only if asked for (lossy)
+    other strings            -> arrow backed strings, if asked for
+
+Every reader taking a dtypes argument accepts None (default dtypes), True (default plan), a dict (explicit schema) or a DtypePlan.
+
+Examples:
+    s3.read_parquet("path/file.parquet", dtypes = True)
+    sf.read("select * from t", dtypes = DtypePlan(schema = {"zip": "string"}, arrow_strings = True))
+"""
+
+import pandas as pd
+from pandas.api.types import CategoricalDtype, union_categoricals
+from lazy_import import lazy_module
+
+# heavy backends, imported on first use
+pa = lazy_module("pyarrow")
+pc = lazy_module("pyarrow.compute")
+
+
+def as_plan(dtypes):
+
+    """
+    Normalizes a reader's dtypes argument to a DtypePlan, or None when no planning is asked for
+    """
+
+    if dtypes is None or dtypes is False:
+        return None
+    if dtypes is True:
+        return DtypePlan()
+    if isinstance(dtypes, dict):
+        return DtypePlan(schema = dtypes)
+    if isinstance(dtypes, DtypePlan):
+        return dtypes
+
+    raise ValueError("dtypes must be None, True, a dict of column dtypes or a DtypePlan")
+
+
+def _is_text(series):
+
+    if isinstance(series.dtype, pd.StringDtype):
+        return True
+
+    return series.dtype == object and pd.api.types.infer_dtype(series, skipna = True) == "string"
+
+
+class DtypePlan:
+
+    def __init__(self, schema = None, sample_rows = 10000, category_ratio = 0.5, downcast = True, float32 = False, arrow_strings = False, chunk_rows = 100000):
+
+        """
+        Params:
+            schema: (dict) explicit column -> dtype, always wins over inference
+            sample_rows: (int) rows sampled to infer the plan where the reader can apply dtypes while parsing
+            category_ratio: (float) strings become categorical when distinct values <= ratio * non-null values
+            downcast: (boolean) shrink integers to the smallest type holding their values
+            float32: (boolean) also store floats as float32, loses precision beyond ~7 digits
+            arrow_strings: (boolean) store the remaining string columns as arrow backed strings
+            chunk_rows: (int) rows per chunk for readers that stream (sql), bounds the peak of uncompacted data
+        """
+
+        self.schema = dict(schema or {})
+        self.sample_rows = sample_rows
+        self.category_ratio = category_ratio
+        self.downcast = downcast
+        self.float32 = float32
+        self.arrow_strings = arrow_strings
+        self.chunk_rows = chunk_rows
+
+    def _string_dtype(self):
+
+        return pd.StringDtype("pyarrow")
+
+    def infer(self, sample):
+
+        """
+        Params:
+            sample: (dataframe object) sample of the data
+
+        Returns:
+            dict of column -> dtype for text columns and the explicit schema, numeric columns are downcast on apply
+        """
+
+        plan = {}
+
+        for col in sample.columns:
+
+            if col in self.schema:
+                plan[col] = self.schema[col]
+                continue
+
+            series = sample[col]
+            if not _is_text(series):
+                continue
+
+            count = series.notna().sum()
+            if count > 0 and series.nunique(dropna = True) <= self.category_ratio * count:
+                plan[col] = "category"
+            elif self.arrow_strings == True:
+                plan[col] = self._string_dtype()
+
+        return plan
+
+    def apply(self, df, plan = None):
+
+        """
+        Compacts a dataframe in place of its default dtypes
+
+        Params:
+            df: (dataframe object) data to compact
+            plan: (dict) result of infer, inferred from df itself if not given
+
+        Returns:
+            pandas dataframe with planned dtypes
+        """
+
+        plan = plan if plan != None else self.infer(df)
+        converted = {}
+
+        for col in df.columns:
+
+            series = df[col]
+
+            if col in plan:
+                if series.dtype != plan[col]:
+                    converted[col] = series.astype(plan[col])
+            elif self.downcast == True and pd.api.types.is_integer_dtype(series.dtype) and not isinstance(series.dtype, pd.api.extensions.ExtensionDtype):
+                converted[col] = pd.to_numeric(series, downcast = "integer")
+            elif self.float32 == True and series.dtype == "float64":
+                converted[col] = series.astype("float32")
+
+        if len(converted) == 0:
+            return df
+
+        return df.assign(**converted)
+
+    def read_csv(self, buffer, **kwargs):
+
+        """
+        Parses csv text with dtypes planned from its first sample_rows, so categoricals never materialize as objects
+
+        Params:
+            buffer: (file like) seekable text buffer
+            kwargs: passed to pandas.read_csv
+        """
+
+        sample = pd.read_csv(buffer, nrows = self.sample_rows, **kwargs)
+        buffer.seek(0)
+
+        plan = self.infer(sample)
+        df = pd.read_csv(buffer, dtype = plan, **kwargs)
+
+        return self.apply(df, plan)
+
+    def from_arrow(self, table):
+
+        """
+        Converts an arrow table to pandas, low-cardinality strings are dictionary encoded in arrow so pandas decodes them to categoricals
+
+        Params:
+            table: (pyarrow table) e.g. from pyarrow.parquet.read_table
+        """
+
+        plan = {}
+
+        for i, field in enumerate(table.schema):
+
+            name = field.name
+
+            if name in self.schema:
+                plan[name] = self.schema[name]
+                continue
+
+            if not (pa.types.is_string(field.type) or pa.types.is_large_string(field.type)):
+                continue
+
+            column = table.column(i)
+            count = len(column) - column.null_count
+            if count > 0 and pc.count_distinct(column).as_py() <= self.category_ratio * count:
+                table = table.set_column(i, name, pc.dictionary_encode(column))
+                plan[name] = "category"
+            elif self.arrow_strings == True:
+                plan[name] = self._string_dtype()
+
+        mapper = {pa.string(): self._string_dtype(), pa.large_string(): self._string_dtype()}.get if self.arrow_strings == True else None
+        df = table.to_pandas(types_mapper = mapper)
+
+        return self.apply(df, plan)
+
+    def from_chunks(self, chunks):
+
+        """
+        Compacts chunked reads (e.g. pandas.read_sql with chunksize) chunk by chunk, the plan is inferred on the first chunk
+
+        Params:
+            chunks: (iterable) dataframes with the same columns
+        """
+
+        plan = None
+        frames = []
+
+        for chunk in chunks:
+
+            if plan == None:
+                plan = self.infer(chunk.head(self.sample_rows))
+
+            frames.append(self.apply(chunk, plan))
+
+        return self.concat(frames)
+
+    def concat(self, frames):
+
+        """
+        Concatenates compacted frames, categoricals with differing categories are unioned instead of falling back to object
+        """
+
+        frames = [x for x in frames]
+        if len(frames) == 0:
+            return pd.DataFrame()
+
+        categorical = set(col for frame in frames for col in frame.columns if isinstance(frame[col].dtype, CategoricalDtype))
+
+        for col in categorical:
+
+            parts = [frame[col].astype("category") for frame in frames if col in frame.columns]
+            dtype = CategoricalDtype(union_categoricals(parts).categories)
+            frames = [frame.assign(**{col: frame[col].astype(dtype)}) if col in frame.columns else frame for frame in frames]
+
+        return pd.concat(frames, ignore_index = True)
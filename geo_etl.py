@@ -10,167 +10,463 @@ This module serves as an api wrapper to easily attain geo data from Google Maps
 
 import pandas as pd
 import numpy as np
-import googlemaps
+import collections
+import contextvars
 import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from checkpoint import CheckpointJob
+from instrumentation import instrumented, logger, record
+from lazy_import import lazy_module
 
-class GMaps:
+# heavy backends, imported on first use
+googlemaps = lazy_module("googlemaps")
+
+def multi_hot(types, sparse = False):
+    
+    """
+    Multi-hot encodes a column of lists in one vectorized pass
+    
+    Params:
+        types: (pandas series) column where every value is a list of labels (or null)
+        sparse: (boolean) return sparse uint8 columns instead of dense ones
+    Returns:
+        pandas dataframe with one 0/1 column per distinct label, aligned to the index of types
+    """
+    
+    # flatten lists and remember which row each label came from
+    lists = [x if isinstance(x, (list, tuple, np.ndarray)) else [] for x in types]
+    lengths = np.fromiter((len(x) for x in lists), dtype = np.int64, count = len(lists))
+    rows = np.repeat(np.arange(len(lists)), lengths)
+    codes, labels = pd.factorize(pd.Series(list(itertools.chain.from_iterable(lists)), dtype = object))
+    
+    # scatter into the indicator matrix at once
+    matrix = np.zeros((len(lists), len(labels)), dtype = np.uint8)
+    matrix[rows, codes] = 1
+    
+    encoded = pd.DataFrame(matrix, index = types.index, columns = list(labels))
+    
+    if sparse == True:
+        encoded = encoded.astype(pd.SparseDtype(np.uint8, 0))
+    
+    return encoded
+
+class RateLimiter:
     
-    def __init__(self, api_key):
+    def __init__(self, qps, burst = None):
         
-        # connect to Google Maps
-        self.gmaps = googlemaps.Client(key = api_key)
+        """
+        Thread safe token bucket used to hold request rate to the api quota
+        
+        Params:
+            qps: (float) sustained requests per second allowed
+            burst: (int) maximum number of requests allowed back to back, defaults to qps
+        """
         
+        self.rate = float(qps)
+        self.capacity = float(burst if burst != None else max(1, qps))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
         
-    def reverse_geocode(self, df, lat_col, long_col):
+    def acquire(self):
         
         """
-        Params:
-            df: (dataframe object) pandas dataframe containing lat/long values
-            lat_col: (string) pandas column name indicating longitude
-            long_col: (string) pandas column name indicating latitude
+        Blocks until a token is available and then consumes it
+        """
+        
+        while True:
             
-        Returns:
-            pandas DataFrame containing the best possible (if possible) address given the lat/long delivered
+            with self.lock:
+                
+                # refill bucket given time since last check
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                wait = (1 - self.tokens) / self.rate
             
-        """
+            time.sleep(wait)
 
-        # initialize final_df
-        geo_final = pd.DataFrame()
-        skipped = 0
+class GMaps:
+    
+    def __init__(self, api_key = None, qps = 50, workers = 8, max_retries = 5, backoff = 1, client = None):
+        
+        """
+        Params:
+            api_key: (string) Google Maps api key
+            qps: (float) queries per second quota shared by all worker threads
+            workers: (int) number of concurrent api calls in flight
+            max_retries: (int) number of retries on OVER_QUERY_LIMIT before a row is skipped
+            backoff: (float) base seconds of the exponential backoff between retries
+            client: (googlemaps.Client) optional pre-built client (or local fake exposing the same methods), replaces api_key
+        """
+        
+        # connect to Google Maps, retries on quota are handled by the scheduler below
+        if client == None:
+            client = googlemaps.Client(key = api_key,
+                                       queries_per_second = qps,
+                                       retry_over_query_limit = False)
+        self.gmaps = client
+        
+        # scheduler settings
+        self.limiter = RateLimiter(qps)
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        
+        # input rows that failed on the last run, kept for a targeted retry
+        self.failed = pd.DataFrame()
+        
+    def _call(self, method, *args, **kwargs):
+        
+        """
+        Rate limited api call, retried with exponential backoff and jitter on OVER_QUERY_LIMIT
         
-        # loop through all lat longs to get Google metadata
-        for i in range(0, len(df)):
+        Params:
+            method: (string) name of the googlemaps.Client method to call
+            args/kwargs: passed through to the client method
+        """
+        
+        for attempt in range(0, self.max_retries + 1):
+            
+            self.limiter.acquire()
+            record(requests = 1, retries = 1 if attempt > 0 else 0)
             
             try:
+                return getattr(self.gmaps, method)(*args, **kwargs)
             
-                # isolate lat long 
-                lat = df.loc[i,lat_col]
-                long = df.loc[i,long_col]
-        
-                # reverse geocode to dataframe
-                reverse_geo = self.gmaps.reverse_geocode((lat, long))
-                temp = pd.DataFrame(reverse_geo).reset_index(drop = False).rename(columns = {"index":"address_rank"})
-                temp[lat_col] = lat
-                temp[long_col] = long
-                geo_final = geo_final.append(temp).reset_index(drop=True)
+            except Exception as e:
                 
-            except:
+                # only quota errors are worth retrying
+                if getattr(e, "status", None) != "OVER_QUERY_LIMIT" or attempt == self.max_retries:
+                    raise
                 
-                skipped += 1
-                next
+                time.sleep(self.backoff * 2 ** attempt + random.uniform(0, self.backoff))
                 
-        # create compound and global (and drop photo and icon bc useless)
-        geo_final["compound_code"] = [geo_final.loc[x,"plus_code"]["compound_code"] if pd.isnull(geo_final.loc[x,"plus_code"]) == False else np.nan for x in range(0, len(geo_final))]
-        geo_final["global_code"] = [geo_final.loc[x,"plus_code"]["global_code"] if pd.isnull(geo_final.loc[x,"plus_code"]) == False else np.nan for x in range(0, len(geo_final))]
-        geo_final = geo_final.drop(columns = ["plus_code"])
+    def _schedule(self, func, items):
+        
+        """
+        Runs func over items on a thread pool, keeping results in input order, failure reasons go to the helpers logger
         
-        # create lat long from geometry
-        geo_final["gmaps_lat"] = [x["location"]["lat"] for x in geo_final["geometry"]]
-        geo_final["gmaps_long"] = [x["location"]["lng"] for x in geo_final["geometry"]]
-        geo_final = geo_final.drop(columns = ["geometry","address_components"])
+        Params:
+            func: (callable) function of one item making its api calls through self._call
+            items: (list) inputs for func
+            
+        Returns:
+            list of results in the order of items (None where the call failed)
+            list of positions within items that failed
+        """
+        
+        def safe(item):
+            try:
+                return func(item), None
+            except Exception as e:
+                return None, f"{type(e).__name__}: {e}"
         
-        # create binary for place type
-        a = [x for x in geo_final["types"]]
-        a_set = list(set(list(itertools.chain.from_iterable(a))))
+        # every item runs in a copy of the caller's context so api calls report into its metrics
+        with ThreadPoolExecutor(max_workers = self.workers) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, safe, item) for item in items]
+            outcomes = [x.result() for x in futures]
         
-        # save binaries as new columns
-        for col in a_set:
-            geo_final.loc[:,col] = [1 if col in geo_final.loc[x,"types"] else 0 for x in range(0, len(geo_final))]
+        results = [x[0] for x in outcomes]
+        failed = [i for i, x in enumerate(outcomes) if x[1] != None]
         
-        # drop types now that binary
-        geo_final = geo_final.drop(columns = ["types"])
+        # one warning per distinct reason, so a bad key or REQUEST_DENIED reads as such instead of as plain failed rows
+        for reason, count in collections.Counter(x[1] for x in outcomes if x[1] != None).items():
+            logger.warning(f"{count} of {len(items)} calls failed: {reason}")
+        
+        return results, failed
+        
+    def _run(self, df, func, key_cols, params, checkpoint_dir, batch_size, retry_failed):
+        
+        """
+        Runs func over df in one go, or batch by batch against a local checkpoint so reruns only pay for missing work
+        
+        Params:
+            func: (callable) takes a dataframe, returns (result dataframe, list of failed positions)
+            key_cols: (list) columns identifying an input row
+            params: (dict) method name and call arguments, a checkpoint only resumes for the same ones
+            checkpoint_dir: (string) checkpoint directory, None to run without checkpointing
+            batch_size: (int) input rows per checkpointed batch
+            retry_failed: (boolean) rerun previously failed rows after the remaining batches
+            
+        Returns:
+            pandas DataFrame of results, failed input rows are left on self.failed
+        """
+        
+        if checkpoint_dir == None:
+            final, failed = func(df)
+            self.failed = df.iloc[failed]
+            return final
+        
+        job = CheckpointJob(checkpoint_dir, batch_size = batch_size)
+        final = job.run(df, func, key_cols, params = params)
+        
+        if retry_failed == True:
+            final = job.retry_failed(func)
+        
+        self.failed = job.failed()
+        
+        return final
+    
+    @instrumented
+    def reverse_geocode(self, df, lat_col, long_col, sparse = False, checkpoint_dir = None, batch_size = 1000, retry_failed = False):
+        
+        """
+        Params:
+            df: (dataframe object) pandas dataframe containing lat/long values
+            lat_col: (string) pandas column name indicating longitude
+            long_col: (string) pandas column name indicating latitude
+            sparse: (boolean) return the place type binaries as sparse columns
+            checkpoint_dir: (string) local directory to checkpoint completed batches to, a rerun with the same df resumes from it
+            batch_size: (int) rows per checkpointed batch
+            retry_failed: (boolean) with checkpoint_dir, also retry rows that failed on earlier runs
+            
+        Returns:
+            pandas DataFrame containing the best possible (if possible) address given the lat/long delivered, 
+            rows that could not be geocoded are left on self.failed
+            
+        """
+        
+        geo_final = self._run(df, lambda x: self._reverse_geocode(x, lat_col, long_col), [lat_col, long_col],
+                              {"method": "reverse_geocode"}, checkpoint_dir, batch_size, retry_failed)
+        
+        # create binary for place type and drop types now that binary
+        if "types" in geo_final.columns:
+            geo_final = geo_final.drop(columns = ["types"]).join(multi_hot(geo_final["types"], sparse = sparse))
         
         return geo_final
     
+    def _reverse_geocode(self, df, lat_col, long_col):
+        
+        """
+        Geocodes one frame of points, returns (flattened results with raw types lists, failed row positions)
+        """
+
+        # reverse geocode all lat longs concurrently to get Google metadata
+        points = list(zip(df[lat_col], df[long_col]))
+        results, failed = self._schedule(lambda x: self._call("reverse_geocode", x), points)
+        skipped = len(failed)
+        record(skipped = skipped)
+        
+        # gather flat records, one per returned address
+        records = [dict(result, address_rank = rank, **{lat_col: lat, long_col: long})
+                   for (lat, long), reverse_geo in zip(points, results) if reverse_geo != None
+                   for rank, result in enumerate(reverse_geo)]
+        
+        # flatten nested fields in one pass
+        geo_final = pd.json_normalize(records)
+        geo_final = geo_final.rename(columns = {"plus_code.compound_code":"compound_code",
+                                                "plus_code.global_code":"global_code",
+                                                "geometry.location.lat":"gmaps_lat",
+                                                "geometry.location.lng":"gmaps_long"})
+        
+        # drop remaining geometry and address components
+        geo_final = geo_final.drop(columns = [x for x in geo_final.columns if x.startswith("geometry.") or x.startswith("plus_code.") or x == "address_components"])
+        
+        return geo_final, failed
+    
     
-    def places_nearby(self, df, lat_col, long_col):
+    @instrumented
+    def places_nearby(self, df, lat_col, long_col, radius = 25, pages = 1, page_delay = 2, sparse = False, checkpoint_dir = None, batch_size = 1000, retry_failed = False):
         
         """
         Params:
             df: (dataframe object) pandas dataframe containing lat/long values
             lat_col: (string) pandas column name indicating longitude
             long_col: (string) pandas column name indicating latitude
+            radius: (int) meters from data point to search within
+            pages: (int) number of result pages to follow through next_page_token (api maximum of 3)
+            page_delay: (float) seconds to wait before requesting a next page, tokens are not valid immediately
+            sparse: (boolean) return the place type binaries as sparse columns
+            checkpoint_dir: (string) local directory to checkpoint completed batches to, a rerun with the same df resumes from it
+            batch_size: (int) rows per checkpointed batch
+            retry_failed: (boolean) with checkpoint_dir, also retry rows that failed on earlier runs
             
         Returns:
-            pandas DataFrame containing details about places near the lat/long, their residential/commercial status and subsequent data points
+            pandas DataFrame containing details about places near the lat/long, their residential/commercial status and subsequent data points,
+            rows whose search failed are left on self.failed
             
         """
         
+        final = self._run(df, lambda x: self._places_nearby(x, lat_col, long_col, radius, pages, page_delay), [lat_col, long_col],
+                          {"method": "places_nearby", "radius": radius, "pages": pages}, checkpoint_dir, batch_size, retry_failed)
+        
+        # create binary for place type and drop types now that binary
+        if "types" in final.columns:
+            final = final.drop(columns = ["types"]).join(multi_hot(final["types"], sparse = sparse))
+        
+        return final
+    
+    def _places_nearby(self, df, lat_col, long_col, radius, pages, page_delay):
+        
+        """
+        Searches around one frame of points, returns (flattened results with raw types lists, failed row positions)
+        """
+        
         ### Step 1: Make API Call and Build Result List
 
-        places_results_list = []
-        skipped = 0 
+        # isolate lat/long
+        points = list(zip(df[lat_col], df[long_col]))
         
-        # loop places API call
-        for j in range(0, len(df)):
-               
-            try:
-                    
-                # isolate lat/long
-                u_lat = df.loc[j,'centroid_latitude']
-                u_long = df.loc[j,'centroid_longitude']
-            
-                # hit google places API for locations within 50 meters
-                google_places_nearby = self.gmaps.places_nearby(location = (f"{u_lat},{u_long}"), 
-                                                           radius = 25, # meters from data point
-                                                           open_now = False)
+        # hit google places API for locations within radius, following result pages
+        def nearby(point):
+            
+            response = self._call("places_nearby",
+                                  location = (f"{point[0]},{point[1]}"),
+                                  radius = radius,
+                                  open_now = False)
+            gpn_result = list(response["results"])
+            
+            for page in range(1, pages):
+                
+                if "next_page_token" not in response:
+                    break
+                
+                time.sleep(page_delay)
                 
-                # isolate places result 
-                gpn_result = google_places_nearby["results"]
+                # a failed follow-up page (e.g. INVALID_REQUEST on a token not active yet) keeps the pages already paid for
+                try:
+                    response = self._call("places_nearby", page_token = response["next_page_token"])
+                except Exception as e:
+                    logger.warning(f"places_nearby stopped paging at page {page + 1} for {point}: {type(e).__name__}: {e}")
+                    break
                 
-                # append to list
-                places_results_list.append({"lat":u_lat, "long": u_long, "result":gpn_result})
+                gpn_result += response["results"]
                 
-            except:
-                skipped += 1
-                next
+            return gpn_result
+        
+        results, failed = self._schedule(nearby, points)
+        skipped = len(failed)
+        record(skipped = skipped)
                 
         ### Step 2: Manipulate Results and Optimize for DS
 
-        final = pd.DataFrame()
-        
-        for i in range(0, len(places_results_list)):
-            
-            # build dataframe for each record that comes through
-            result_temp = places_results_list[i]["result"]
-            result_temp = pd.DataFrame(result_temp)
-            result_temp["centroid_lat"] = places_results_list[i]["lat"]
-            result_temp["centroid_long"] = places_results_list[i]["long"]
-            result_temp = result_temp.T
-            
-            # liberal merge on index 
-            if i == 0:
-                final = result_temp
-            else:
-                final = final.merge(result_temp, left_index = True, right_index = True, how = "outer")
+        # gather flat records, one per place found
+        records = [dict(place, centroid_lat = u_lat, centroid_long = u_long)
+                   for (u_lat, u_long), gpn_result in zip(points, results) if gpn_result != None
+                   for place in gpn_result]
         
-        # transpose back
-        final = final.T.reset_index(drop = True)
+        # flatten nested fields in one pass
+        final = pd.json_normalize(records)
+        final = final.rename(columns = {"geometry.location.lat":"places_lat",
+                                        "geometry.location.lng":"places_long",
+                                        "plus_code.compound_code":"compound_code",
+                                        "plus_code.global_code":"global_code"})
         
-        # create lat long from geometry
-        final["places_lat"] = [x["location"]["lat"] for x in final["geometry"]]
-        final["places_long"] = [x["location"]["lng"] for x in final["geometry"]]
-        final = final.drop(columns = ["geometry"])
+        # drop remaining geometry, photo and icon bc useless
+        final = final.drop(columns = [x for x in final.columns if x.split(".")[0] in ["geometry","plus_code","photos","icon","opening_hours"]])
         
-        # create compound and global (and drop photo and icon bc useless)
-        final["compound_code"] = [final.loc[x,"plus_code"]["compound_code"] if pd.isnull(final.loc[x,"plus_code"]) == False else np.nan for x in range(0, len(final))]
-        final["global_code"] = [final.loc[x,"plus_code"]["global_code"] if pd.isnull(final.loc[x,"plus_code"]) == False else np.nan for x in range(0, len(final))]
-        final = final.drop(columns = ["plus_code","photos","icon","opening_hours"])
+        return final, failed
+    
+# geohash base32 alphabet and reverse lookup by character code
+GEOHASH_BASE32 = np.array(list("0123456789bcdefghjkmnpqrstuvwxyz"))
+GEOHASH_LOOKUP = np.full(128, -1, dtype = np.int8)
+GEOHASH_LOOKUP[[ord(x) for x in GEOHASH_BASE32]] = np.arange(32)
+
+def _to_numpy(values, dtype):
+    
+    """
+    Casts pandas series, pyarrow arrays or array likes to a numpy array, nulls become nan/None
+    """
+    
+    if isinstance(values, (pd.Series, pd.Index)):
+        return values.to_numpy(dtype = dtype, na_value = np.nan if dtype == float else None)
+    if hasattr(values, "to_numpy") and hasattr(values, "null_count"):
+        values = values.to_numpy(zero_copy_only = False)
+    
+    return np.asarray(values, dtype = dtype)
+
+def geohash_encode(lat, long, precision = 12):
+    
+    """
+    Vectorized geohash encoding, bits are interleaved over the whole array at once
+    
+    Params:
+        lat: (array like) latitude values as pandas series, pyarrow array or numpy array
+        long: (array like) longitude values, same length as lat
+        precision: (int) length of the geohash, 12 characters resolves to a few centimeters
+    Returns:
+        numpy array of geohash strings (None where lat or long is null), or pandas series if lat is a series
+    """
+    
+    lats = _to_numpy(lat, float)
+    longs = _to_numpy(long, float)
+    valid = ~(np.isnan(lats) | np.isnan(longs))
+    
+    # interval bounds per point, refined one bit at a time (even bits longitude, odd bits latitude)
+    bounds = [np.full((2, len(lats)), [[-180.0], [180.0]]), np.full((2, len(lats)), [[-90.0], [90.0]])]
+    values = [np.where(valid, longs, 0), np.where(valid, lats, 0)]
+    chars = np.zeros((len(lats), precision), dtype = np.int64)
+    
+    for bit in range(0, precision * 5):
         
-        # create binary for place type
-        a = [x for x in final["types"]]
-        a_set = list(set(list(itertools.chain.from_iterable(a))))
+        lo, hi = bounds[bit % 2]
+        mid = (lo + hi) / 2
+        upper = values[bit % 2] >= mid
         
-        # save binaries as new columns
-        for col in a_set:
-            final.loc[:,col] = [1 if col in final.loc[x,"types"] else 0 for x in range(0, len(final))]
+        lo[upper] = mid[upper]
+        hi[~upper] = mid[~upper]
+        chars[:, bit // 5] = (chars[:, bit // 5] << 1) | upper
+    
+    # map 5 bit groups to characters and glue each row into one string
+    codes = np.ascontiguousarray(GEOHASH_BASE32[chars]).view(f"<U{precision}").ravel().astype(object)
+    codes[~valid] = None
+    
+    if isinstance(lat, pd.Series):
+        return pd.Series(codes, index = lat.index, name = "GeoHash")
+    
+    return codes
+
+def geohash_decode(codes):
+    
+    """
+    Vectorized geohash decoding to the center of each cell
+    
+    Params:
+        codes: (array like) geohash strings as pandas series, pyarrow array or numpy array, nulls and invalid codes decode to nan
+    Returns:
+        tuple of numpy arrays (latitude, longitude), or a pandas dataframe with Latitude/Longitude columns if codes is a series
+    """
+    
+    raw = _to_numpy(codes, object)
+    strings = np.array(["" if not isinstance(x, str) else x.lower() for x in raw], dtype = str)
+    width = max(strings.dtype.itemsize // 4, 1)
+    
+    # character codes as a 2d array, padding is 0
+    points = np.ascontiguousarray(strings.astype(f"<U{width}")).view(np.uint32).reshape(len(strings), width)
+    digits = np.where(points < 128, GEOHASH_LOOKUP[np.minimum(points, 127)], -1)
+    lengths = np.char.str_len(strings)
+    valid = (lengths > 0) & ((digits >= 0) | (np.arange(width) >= lengths[:, None])).all(axis = 1)
+    
+    bounds = [np.full((2, len(strings)), [[-180.0], [180.0]]), np.full((2, len(strings)), [[-90.0], [90.0]])]
+    
+    for bit in range(0, width * 5):
         
-        # drop types now that binary
-        final = final.drop(columns = ["types"])
+        lo, hi = bounds[bit % 2]
+        mid = (lo + hi) / 2
+        active = bit // 5 < lengths
+        upper = ((digits[:, bit // 5] >> (4 - bit % 5)) & 1).astype(bool)
         
-        return final
+        lo[:] = np.where(active & upper, mid, lo)
+        hi[:] = np.where(active & ~upper, mid, hi)
+    
+    longs = np.where(valid, bounds[0].mean(axis = 0), np.nan)
+    lats = np.where(valid, bounds[1].mean(axis = 0), np.nan)
     
-def geo_encode(df, lat, long, precision = 23):
+    if isinstance(codes, pd.Series):
+        return pd.DataFrame({"Latitude": lats, "Longitude": longs}, index = codes.index)
+    
+    return lats, longs
+
+def geo_encode(df, lat, long, precision = 12):
     
     """
     The intent of this function is to take a pyspark dataframe with the lat/long column names specified and return a geohash column included
@@ -179,52 +475,195 @@ def geo_encode(df, lat, long, precision = 23):
         df: (pyspark dataframe) pyspark dataframe containing lat/long columns
         lat: (str) indicator of column name of latitude values
         long: (str) indicator of column name of longitude values
-        precision: (int) length of the geohash, default set to 23 character geohash because this equals 6 decimals of precision 
+        precision: (int) length of the geohash, default set to 12 characters which resolves to a few centimeters
     Returns:
         pyspark dataframe with additional column
     """
-
-    # convert data types
-    df = df.withColumn(lat, df[lat].cast(DecimalType(10,6)).alias(lat))
-    df = df.withColumn(long, df[long].cast(DecimalType(10,6)).alias(long))
-
-    # create geohash function
-    ps_geohash_encode = udf(lambda x,y: "unknown" if pd.isnull(x) or pd.isnull(y) else geohash.encode(x,y,precision=precision))
+    
+    from pyspark.sql.functions import pandas_udf
+    
+    # create geohash function, runs on arrow batches
+    @pandas_udf("string")
+    def ps_geohash_encode(x, y):
+        return geohash_encode(x, y, precision = precision).fillna("unknown")
 
     # apply it to dataframe
-    df = df.withColumn("GeoHash",ps_geohash_encode(lat,long))
+    df = df.withColumn("GeoHash", ps_geohash_encode(df[lat].cast("double"), df[long].cast("double")))
     
     return df
 
 def geo_decode(df, code):
     
     """
-    The intent of this function is to take a pyspark dataframe with the lat/long column names specified and return the dataframe lat/long columns included
+    The intent of this function is to take a pyspark dataframe with the geohash column name specified and return the dataframe lat/long columns included
     
     Params:
         df: (pyspark dataframe) pyspark dataframe containing geohash columns
-        code: (str) geocode column name to be decoded utilizing (python-geocode pip package)
-    Dependencies:
-        with_column_index: (udf) adds column index to pyspark dataframe
+        code: (str) geohash column name to be decoded, "unknown" or invalid codes decode to null
     Returns:
         pyspark dataframe with additional columns
     """
     
-    # decode geohash function
-    schema = StructType([StructField("Latitude", FloatType(), False), StructField("Longitude", FloatType(), False)])
-    geohash_decode = udf(lambda x: (None,None) if x == "unknown" else geohash.decode(x), schema)
-
-    # apply results of two columns to one
-    schema = StructType([StructField("Latitude", FloatType(), False), StructField("Longitude", FloatType(), False)])
+    from pyspark.sql.functions import pandas_udf
+    
+    # decode geohash function, runs on arrow batches and returns a struct
+    @pandas_udf("Latitude double, Longitude double")
+    def geohash_decode_udf(x):
+        return geohash_decode(x)
 
-    # run decode to two columns
-    temp = df.select(geohash_decode(code).alias("ReverseGeoHash"))
+    # run decode in place and expand struct to two columns
+    df = df.withColumn("ReverseGeoHash", geohash_decode_udf(df[code]))
+    df = df.select("*", "ReverseGeoHash.*").drop("ReverseGeoHash")
+    
+    return df
 
-    # create column indexes
-    temp_ci = with_column_index(temp.select("ReverseGeoHash.*"))
-    df_ci = with_column_index(df)
+# mean earth radius used for haversine distances
+EARTH_RADIUS_M = 6371008.8
 
-    # join original to original dataframe
-    df = df_ci.join(temp_ci, df_ci.ColumnIndex == temp_ci.ColumnIndex, 'inner').drop("ColumnIndex")
+class SpatialIndex:
     
-    return df
\ No newline at end of file
+    def __init__(self, df, lat_col, long_col):
+        
+        """
+        Haversine ball tree over previously fetched geo results, answers batch nearest/radius lookups locally
+        
+        Params:
+            df: (dataframe object) pandas dataframe of places, e.g. GMaps.reverse_geocode or GMaps.places_nearby results
+            lat_col: (string) pandas column name indicating latitude
+            long_col: (string) pandas column name indicating longitude
+        """
+        
+        from sklearn.neighbors import BallTree
+        
+        # keep only locatable rows
+        self.df = df[df[lat_col].notnull() & df[long_col].notnull()].reset_index(drop = True)
+        self.lat_col = lat_col
+        self.long_col = long_col
+        
+        if len(self.df) == 0:
+            raise ValueError(f"SpatialIndex needs at least one row with both {lat_col} and {long_col} set")
+        
+        # build tree on radians, haversine distances come back in radians
+        self.tree = BallTree(np.radians(self.df[[lat_col, long_col]].to_numpy(dtype = float)), metric = "haversine")
+        
+    @classmethod
+    def from_reverse_geocode(cls, df):
+        
+        """
+        Builds the index from GMaps.reverse_geocode output
+        """
+        
+        return cls(df, "gmaps_lat", "gmaps_long")
+    
+    @classmethod
+    def from_places_nearby(cls, df):
+        
+        """
+        Builds the index from GMaps.places_nearby output
+        """
+        
+        return cls(df, "places_lat", "places_long")
+    
+    def _points(self, points, lat_col, long_col):
+        
+        """
+        Returns query points as radians and the labels used to refer back to them
+        """
+        
+        if isinstance(points, pd.DataFrame):
+            coords = points[[lat_col or self.lat_col, long_col or self.long_col]].to_numpy(dtype = float)
+            labels = points.index
+        else:
+            coords = np.asarray(points, dtype = float).reshape(-1, 2)
+            labels = pd.RangeIndex(len(coords))
+        
+        return np.radians(coords), labels
+    
+    def _matches(self, labels, positions, distances, ranks):
+        
+        """
+        Joins match positions back to the indexed rows
+        """
+        
+        # no query points, same columns without rows
+        if len(positions) == 0:
+            positions, distances, ranks = np.array([], dtype = np.int64), np.array([], dtype = float), np.array([], dtype = np.int64)
+        
+        matches = self.df.iloc[positions].reset_index(drop = True)
+        matches.insert(0, "distance_m", distances * EARTH_RADIUS_M)
+        matches.insert(0, "rank", ranks)
+        matches.insert(0, "query_index", labels)
+        
+        return matches
+    
+    def nearest(self, points, k = 1, lat_col = None, long_col = None):
+        
+        """
+        Params:
+            points: (dataframe object or array like) query points, either a dataframe with lat/long columns or an (n, 2) array of lat/long
+            k: (int) number of neighbors to return per point
+            lat_col: (string) latitude column of points, defaults to the column name of the index
+            long_col: (string) longitude column of points, defaults to the column name of the index
+            
+        Returns:
+            pandas DataFrame with k rows per point: query_index, rank, distance_m and the matching indexed row
+        """
+        
+        coords, labels = self._points(points, lat_col, long_col)
+        if len(coords) == 0:
+            return self._matches(labels, [], [], [])
+        
+        k = min(k, len(self.df))
+        distances, positions = self.tree.query(coords, k = k)
+        
+        return self._matches(np.repeat(labels, k), positions.ravel(), distances.ravel(), np.tile(np.arange(k), len(coords)))
+    
+    def within(self, points, radius_m, lat_col = None, long_col = None):
+        
+        """
+        Params:
+            points: (dataframe object or array like) query points, either a dataframe with lat/long columns or an (n, 2) array of lat/long
+            radius_m: (float) search radius in meters
+            lat_col: (string) latitude column of points, defaults to the column name of the index
+            long_col: (string) longitude column of points, defaults to the column name of the index
+            
+        Returns:
+            pandas DataFrame with one row per indexed place within radius of a point, ordered by distance per point
+        """
+        
+        coords, labels = self._points(points, lat_col, long_col)
+        if len(coords) == 0:
+            return self._matches(labels, [], [], [])
+        
+        positions, distances = self.tree.query_radius(coords, r = radius_m / EARTH_RADIUS_M, return_distance = True, sort_results = True)
+        counts = np.array([len(x) for x in positions], dtype = np.int64)
+        
+        # rank restarts at 0 for every point
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        ranks = np.arange(counts.sum()) - starts
+        
+        return self._matches(np.repeat(labels, counts),
+                             np.concatenate(positions).astype(np.int64) if len(positions) else np.array([], dtype = np.int64),
+                             np.concatenate(distances) if len(distances) else np.array([]),
+                             ranks)
+    
+    def covered(self, points, radius_m, lat_col = None, long_col = None):
+        
+        """
+        Params:
+            points: (dataframe object or array like) query points, either a dataframe with lat/long columns or an (n, 2) array of lat/long
+            radius_m: (float) search radius in meters
+            lat_col: (string) latitude column of points, defaults to the column name of the index
+            long_col: (string) longitude column of points, defaults to the column name of the index
+            
+        Returns:
+            boolean pandas Series, True where a point already has an indexed place within radius and an api call can be skipped
+        """
+        
+        coords, labels = self._points(points, lat_col, long_col)
+        if len(coords) == 0:
+            return pd.Series([], index = labels, dtype = bool)
+        
+        counts = self.tree.query_radius(coords, r = radius_m / EARTH_RADIUS_M, count_only = True)
+        
+        return pd.Series(counts > 0, index = labels)
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This module is intended to serve as a shared instrumentation layer for the helper classes.
+
+Every instrumented method records wall time, rows, bytes transferred, api requests, retries and (optionally) peak memory.
+SQL clients report the in-memory size of the frames they read or write as frame_bytes, bytes is only ever wire/body bytes.
+Finished calls are sent to the "helpers" logger, to any registered hooks and to the in-process metrics registry.
+
+Examples:
+    import instrumentation
+    instrumentation.registry.add_hook(lambda call: print(call["name"], call["seconds"]))
+    instrumentation.track_memory(True)
+    ...
+    instrumentation.registry.summary()
+"""
+
+import collections
+import contextvars
+import functools
+import logging
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+logger = logging.getLogger("helpers")
+
+# counters every call reports, even when zero
+COUNTERS = ["rows", "bytes", "frame_bytes", "requests", "retries", "skipped"]
+
+# call currently running in this thread/context
+_current = contextvars.ContextVar("helpers_current_call", default = None)
+
+# memory tracking is off by default, tracemalloc slows allocation heavy code
+_track_memory = False
+
+
+def track_memory(enabled = True):
+
+    """
+    Turns peak memory tracking (via tracemalloc) on or off for all instrumented calls
+    """
+
+    global _track_memory
+    _track_memory = enabled
+
+
+class Call:
+
+    def __init__(self, name, parent = None):
+
+        """
+        Metrics of one running call, counters are thread safe so worker threads can report into it
+
+        Params:
+            name: (string) qualified method name, e.g. S3.read_parquet
+            parent: (Call) enclosing instrumented call, receives this call's counters when it finishes
+        """
+
+        self.name = name
+        self.parent = parent
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.seconds = None
+        self.peak_memory = None
+        self.error = None
+
+    def add(self, **counts):
+
+        """
+        Increments counters, e.g. call.add(bytes = 1024, requests = 1)
+        """
+
+        with self.lock:
+            for key, value in counts.items():
+                self.counts[key] = self.counts.get(key, 0) + value
+
+    def as_dict(self):
+
+        return dict(name = self.name,
+                    started = self.started,
+                    seconds = self.seconds,
+                    peak_memory = self.peak_memory,
+                    error = self.error,
+                    **self.counts)
+
+
+class MetricsRegistry:
+
+    def __init__(self, history = 10000):
+
+        """
+        In-process store of finished calls and running totals per method
+
+        Params:
+            history: (int) number of most recent calls kept
+        """
+
+        self.calls = collections.deque(maxlen = history)
+        self.totals = {}
+        self.hooks = []
+        self.lock = threading.Lock()
+
+    def add_hook(self, hook):
+
+        """
+        Registers a callback receiving the metrics dict of every finished call
+        """
+
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+
+        self.hooks.remove(hook)
+
+    def record(self, call):
+
+        """
+        Stores a finished call, updates totals and runs hooks
+        """
+
+        metrics = call.as_dict()
+
+        with self.lock:
+
+            self.calls.append(metrics)
+
+            totals = self.totals.setdefault(call.name, dict(calls = 0, errors = 0, seconds = 0.0, peak_memory = 0, **dict.fromkeys(COUNTERS, 0)))
+            totals["calls"] += 1
+            totals["errors"] += metrics["error"] != None
+            totals["seconds"] += metrics["seconds"]
+            totals["peak_memory"] = max(totals["peak_memory"], metrics["peak_memory"] or 0)
+            for key, value in call.counts.items():
+                totals[key] = totals.get(key, 0) + value
+
+        for hook in list(self.hooks):
+            try:
+                hook(metrics)
+            except Exception:
+                logger.exception(f"metrics hook {hook!r} failed")
+
+    def summary(self):
+
+        """
+        Returns:
+            pandas dataframe of totals per instrumented method
+        """
+
+        with self.lock:
+            return pd.DataFrame.from_dict(self.totals, orient = "index").rename_axis("name")
+
+    def history(self):
+
+        """
+        Returns:
+            pandas dataframe with one row per recent call
+        """
+
+        with self.lock:
+            return pd.DataFrame(list(self.calls))
+
+    def reset(self):
+
+        with self.lock:
+            self.calls.clear()
+            self.totals = {}
+
+
+registry = MetricsRegistry()
+
+
+def current_call():
+
+    """
+    Returns the instrumented call running in this context, or None
+    """
+
+    return _current.get()
+
+
+def record(**counts):
+
+    """
+    Adds counters to the running call, no-op outside of instrumented methods
+
+    Examples:
+        record(bytes = len(body))
+        record(requests = 1, retries = 1)
+    """
+
+    call = _current.get()
+
+    if call != None:
+        call.add(**counts)
+
+
+def instrumented(func):
+
+    """
+    Decorator timing a helper method and publishing its metrics on completion
+
+    Rows are taken from a returned dataframe unless the method recorded them itself.
+    Counters recorded by nested instrumented calls roll up into the enclosing call.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+
+        name = func.__qualname__
+        call = Call(name, parent = _current.get())
+        token = _current.set(call)
+
+        # only the outermost call owns tracemalloc
+        owns_memory = _track_memory and not tracemalloc.is_tracing()
+        if owns_memory:
+            tracemalloc.start()
+
+        start = time.perf_counter()
+
+        try:
+
+            result = func(*args, **kwargs)
+
+            if call.counts["rows"] == 0:
+                frame = result[0] if isinstance(result, tuple) and len(result) > 0 else result
+                if isinstance(frame, pd.DataFrame):
+                    call.add(rows = len(frame))
+
+            return result
+
+        except Exception as e:
+
+            call.error = f"{type(e).__name__}: {e}"
+            raise
+
+        finally:
+
+            call.seconds = time.perf_counter() - start
+
+            if owns_memory:
+                call.peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+            _current.reset(token)
+
+            if call.parent != None:
+                call.parent.add(**call.counts)
+
+            registry.record(call)
+
+            logger.info(f"{name} {call.seconds:.3f}s " + " ".join(f"{k}={v}" for k, v in call.counts.items() if v)
+                        + (f" peak_memory={call.peak_memory}" if call.peak_memory != None else "")
+                        + (f" error={call.error}" if call.error != None else ""))
+
+    return wrapper
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This module is intended to defer importing heavy, optional backends (boto3, pyarrow, sqlalchemy, googlemaps, ...) until first use.
+
+Helper modules bind backends with lazy_module at import time, the real import happens on the first attribute access,
+so short-lived jobs only pay for the backends they actually touch.
+
+Examples:
+    boto3 = lazy_module("boto3")
+    boto3.client("s3")  # boto3 is imported here
+"""
+
+import importlib
+import threading
+
+_lock = threading.RLock()
+
+
+class LazyModule:
+
+    def __init__(self, name, on_load = None):
+
+        """
+        Params:
+            name: (string) absolute module name, e.g. pyarrow.parquet
+            on_load: (callable) optional function run once with the module right after it is imported
+        """
+
+        self._name = name
+        self._on_load = on_load
+        self._module = None
+
+    def _load(self):
+
+        # double checked so concurrent first uses import once
+        if self._module == None:
+            with _lock:
+                if self._module == None:
+                    module = importlib.import_module(self._name)
+                    if self._on_load != None:
+                        self._on_load(module)
+                    self._module = module
+
+        return self._module
+
+    def __getattr__(self, attr):
+
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+
+        return dir(self._load())
+
+    def __repr__(self):
+
+        state = "loaded" if self._module != None else "not loaded"
+
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_module(name, on_load = None):
+
+    """
+    Returns a proxy importing the module on first attribute access
+
+    Params:
+        name: (string) absolute module name
+        on_load: (callable) optional function run once with the module right after it is imported
+    """
+
+    return LazyModule(name, on_load = on_load)
@@ -4,9 +4,13 @@
 This python class is a wrapper on a windows authentification methodology of connecting to MSSQL server
 """
 
-import sqlalchemy as db
 import pandas as pd
-import pymssql
+from dtype_plan import as_plan
+from instrumentation import instrumented, record
+from lazy_import import lazy_module
+
+# heavy backends, imported on first use (the pymssql driver is loaded by the sqlalchemy dialect)
+db = lazy_module("sqlalchemy")
     
 class client:
     
@@ -22,14 +26,36 @@ class client:
         df = spark.read.jdbc(url = self.engine, table = query)
         return df
     
+    @instrumented
     def truncate(self, name, schema):
         self.connection.execute( f"""TRUNCATE TABLE {self.database}.{schema}.{name}""" )
+        record(requests = 1)
  
-    def from_sql(self, query):
-        self.result = pd.read_sql(query, self.connection)
+    @instrumented
+    def from_sql(self, query, dtypes = None):
+        plan = as_plan(dtypes)
+        if plan != None:
+            self.result = plan.from_chunks(pd.read_sql(query, self.connection, chunksize = plan.chunk_rows))
+        else:
+            self.result = pd.read_sql(query, self.connection)
+        record(rows = len(self.result), frame_bytes = int(self.result.memory_usage(deep = True).sum()), requests = 1)
+        
+    def read_batches(self, query, batch_size = 100000):
+        
+        """
+        Stream a query as a generator of dataframes on its own connection, results are fetched server side in batches
+        """
+        
+        with self.engine.connect() as con:
+            record(requests = 1)
+            for df in pd.read_sql(query, con.execution_options(stream_results = True), chunksize = batch_size):
+                record(rows = len(df), frame_bytes = int(df.memory_usage(deep = True).sum()))
+                yield df
         
+    @instrumented
     def to_sql(self, data, name, schema, if_exists, index = False, dtypes = None):
         data.to_sql(name = name, con = self.connection, schema =schema, if_exists = if_exists, index = index, dtype = dtypes)
+        record(rows = len(data), frame_bytes = int(data.memory_usage(deep = True).sum()), requests = 1)
             
     def close_conn(self):
         self.connection.close()
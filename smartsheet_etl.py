@@ -4,9 +4,15 @@
 This module is intended to serve as a wrapper for the smartsheet API in order to make for ease of use.
 """
 
-import smartsheet
 import pandas as pd
-from simple_smartsheet.models import Sheet, Column, Row, ColumnType
+from dtype_plan import as_plan
+from checkpoint import CheckpointJob
+from instrumentation import instrumented, record
+from lazy_import import lazy_module
+
+# heavy backends, imported on first use
+smartsheet = lazy_module("smartsheet")
+models = lazy_module("simple_smartsheet.models")
 
 ##### Smartsheet API Helper Class
 
@@ -19,6 +25,7 @@ class ss_client:
         """
         self.smart = smartsheet.Smartsheet(token)
 
+    @instrumented
     def smartsheet_get(self, sheet_id):
         
         """
@@ -26,13 +33,15 @@ class ss_client:
         """
         
         sheet = self.smart.Sheets.get_sheet(sheet_id = sheet_id)
+        record(requests = 1)
         
         return sheet
     
-    def simple_sheet_to_dataframe(sheet):
+    @instrumented
+    def simple_sheet_to_dataframe(sheet, dtypes = None):
         
         """
-        turns sheet object to pandas dataframe for ease of use
+        turns sheet object to pandas dataframe for ease of use, dtypes optionally compacts columns (True, dict or DtypePlan, see dtype_plan)
         """
         
         col_names = [col.title for col in sheet.columns]
@@ -46,9 +55,14 @@ class ss_client:
             
         data_frame = pd.DataFrame(rows, columns=col_names)
         
+        plan = as_plan(dtypes)
+        if plan != None:
+            data_frame = plan.apply(data_frame)
+        
         return data_frame
     
-    def tl_ss(self, sheet_name, df, key):
+    @instrumented
+    def tl_ss(self, sheet_name, df, key, checkpoint_dir = None, batch_size = 500):
         
         
         """
@@ -66,6 +80,11 @@ class ss_client:
             
             key: establish key column
             
+            checkpoint_dir: local directory to checkpoint written row batches to, a rerun with the same df 
+                            keeps the sheet and only adds the batches still missing
+            
+            batch_size: rows per checkpointed add_rows call
+            
         returns:
             
             writes dataframe to smartsheet under specified sheet name if completed
@@ -75,39 +94,72 @@ class ss_client:
         
         # isolate df columns
         cols = list(df.dtypes.index)
-        skeleton = [Column(title=x, type=ColumnType.TEXT_NUMBER) if x != key else Column(primary=True, title=x, type=ColumnType.TEXT_NUMBER) for x in cols]
-        
-        # get sheets associated with token
-        sheets = self.smart.sheets.list()
-        
-        # delete the test sheet if already exists
-        for sheet in sheets:
-            if sheet.name == sheet_name:
-                smartsheet.sheets.delete(id=sheet.id)
-                
-        # create a new sheet skeleton
-        new_sheet_skeleton = Sheet(name=sheet_name, columns=skeleton)
-        
-        # add the blank sheet via API
-        result = smartsheet.sheets.create(new_sheet_skeleton)
-        sheet = result.obj
-        print(f"ID of the created sheet is {sheet.id!r}")
+        skeleton = [models.Column(title=x, type=models.ColumnType.TEXT_NUMBER) if x != key else models.Column(primary=True, title=x, type=models.ColumnType.TEXT_NUMBER) for x in cols]
+        
+        # open checkpoint, resuming skips the delete/create steps once the sheet id was recorded
+        job = None
+        sheet_id = None
+        if checkpoint_dir != None:
+            job = CheckpointJob(checkpoint_dir, batch_size = batch_size)
+            job.start(df, [key], params = {"method": "tl_ss"}, sheet_name = sheet_name)
+            if job.extra["sheet_name"] != sheet_name:
+                raise ValueError(f"Checkpoint at {checkpoint_dir} belongs to sheet {job.extra['sheet_name']!r}")
+            sheet_id = job.extra.get("sheet_id")
+        
+        if sheet_id == None:
+        
+            # get sheets associated with token
+            sheets = self.smart.sheets.list()
+            record(requests = 1)
+            
+            # delete the test sheet if already exists
+            for sheet in sheets:
+                if sheet.name == sheet_name:
+                    smartsheet.sheets.delete(id=sheet.id)
+                    record(requests = 1)
+                    
+            # create a new sheet skeleton
+            new_sheet_skeleton = models.Sheet(name=sheet_name, columns=skeleton)
+            
+            # add the blank sheet via API
+            result = smartsheet.sheets.create(new_sheet_skeleton)
+            record(requests = 1)
+            sheet_id = result.obj.id
+            print(f"ID of the created sheet is {sheet_id!r}")
+            
+            # only a created sheet makes the checkpoint resumable
+            if job != None:
+                job.update_extra(sheet_id = sheet_id)
+            
+        else:
+            print(f"Resuming {sheet_name} (ID {sheet_id!r}) from checkpoint {checkpoint_dir}")
         
         # isolate sheet
-        sheet = self.smart.sheets.get(sheet_name)
+        sheet = self.smart.sheets.get(id = sheet_id)
+        record(requests = 1)
         
-        # create new row list
-        new_rows = []
-        for i in range(0,len(df)):
+        def add_rows(batch):
             
-            new_rows.append(Row(to_top=True,
-                                cells=sheet.make_cells({x: df.loc[i,x] for x in cols})))
+            # create new row list
+            new_rows = []
+            for i in batch.index:
+                
+                new_rows.append(models.Row(to_top=True,
+                                    cells=sheet.make_cells({x: batch.loc[i,x] for x in cols})))
+            
+            # write to ss
+            smartsheet.sheets.add_rows(sheet.id, new_rows)
+            record(rows = len(new_rows), requests = 1)
+            
+            return batch[[key]], []
         
-        # write to ss
-        smartsheet.sheets.add_rows(sheet.id, new_rows)
+        if job == None:
+            add_rows(df)
+        else:
+            job.run(df, add_rows, [key])
         
         # sort
         sheet = smartsheet.sheets.sort_rows(
             sheet, [{"column_title": key, "descending": False}]
         )
-        
+        record(requests = 1)
@@ -5,10 +5,16 @@ This python class is a wrapper on connecting to, and performing operations with,
 """
 
 import pandas as pd
-from sqlalchemy import create_engine
-from snowflake.sqlalchemy import URL 
-from sqlalchemy.dialects import registry
-registry.register('snowflake', 'snowflake.sqlalchemy', 'dialect')
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dtype_plan import as_plan
+from instrumentation import instrumented, record
+from lazy_import import lazy_module
+
+# heavy backends, imported (and the snowflake dialect registered) on first use
+sqlalchemy = lazy_module("sqlalchemy")
+snowflake_sqlalchemy = lazy_module("snowflake.sqlalchemy",
+                                   on_load = lambda x: sqlalchemy.dialects.registry.register('snowflake', 'snowflake.sqlalchemy', 'dialect'))
 
 class client:
     
@@ -23,31 +29,63 @@ class client:
         self.schema = schema
         
         # Instantiate Engine
-        self.engine = create_engine(URL(account = self.account,
+        self.engine = sqlalchemy.create_engine(snowflake_sqlalchemy.URL(account = self.account,
                                         user = self.username,
                                         authenticator = self.authenticator,
                                         warehouse = self.warehouse,
                                         database = self.database,
                                         schema = self.schema))
         
-    def read(self, query):
+    @instrumented
+    def read(self, query, dtypes = None):
         
         """
         Read snowflake table into script
         
         Params:
             query : string containing snowflake query
+            dtypes : optional dtype plan (True, dict or DtypePlan), rows are then fetched and compacted chunk by chunk, see dtype_plan
         """
+        
+        plan = as_plan(dtypes)
     
         with self.engine.connect() as con:
-    
-            df = pd.read_sql(query, con)
+            
+            if plan != None:
+                df = plan.from_chunks(pd.read_sql(query, con, chunksize = plan.chunk_rows))
+            else:
+                df = pd.read_sql(query, con)
+            
+            record(rows = len(df), frame_bytes = int(df.memory_usage(deep = True).sum()), requests = 1)
             
             print(f"--- Read Query From Snowflake")
             
         return df
+    
+    def read_batches(self, query, batch_size = 100000):
+        
+        """
+        Stream a snowflake query as a generator of dataframes, results are fetched server side in batches
+        
+        Params:
+            query : string containing snowflake query
+            batch_size : number of rows per yielded dataframe
+        """
+        
+        with self.engine.connect() as con:
+            
+            record(requests = 1)
+            
+            for df in pd.read_sql(query, con.execution_options(stream_results = True), chunksize = batch_size):
+                
+                record(rows = len(df), frame_bytes = int(df.memory_usage(deep = True).sum()))
+                
+                yield df
+            
+            print(f"--- Streamed Query From Snowflake")
         
 
+    @instrumented
     def create(self, data, table_name, index = False):
         
         """
@@ -65,9 +103,12 @@ class client:
                         con=con, 
                         if_exists="replace", 
                         index=index)
+
+            record(rows = len(data), frame_bytes = int(data.memory_usage(deep = True).sum()), requests = 1)
             
             print(f"--- Completed {table_name} Create In Snowflake")
 
+    @instrumented
     def execute(self, query):
         
         """
@@ -86,9 +127,99 @@ class client:
         with self.engine.connect() as con:
                 
             con.execute(query)
+            record(requests = 1)
             
             print(f"--- Completed Query In Snowflake")            
             
+    @instrumented
+    def copy_from_s3(self, s3, prefix, table_name, bucket_name = None, stage = None, storage_integration = None, pattern = None,
+                     file_format = "TYPE = PARQUET", copy_options = "MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE",
+                     files_per_copy = 1000, parallel = 4, history_days = 14, force = False):
+        
+        """
+        Load files sitting in S3 into an existing snowflake table with COPY INTO, data never passes through this machine
+        
+        Params:
+            s3 : instantiated aws_etl.S3 used to list the files
+            prefix : file location prefix within the bucket, files are loaded relative to its folder
+            table_name : name of snowflake table that will be loaded, given engine parameters
+            bucket_name : name of bucket, defaults to the S3 instance's bucket
+            stage : existing external stage pointing at the prefix folder, (re)registered as <table_name>_s3_stage on every call if not given
+            storage_integration : storage integration used when registering the stage, required if no stage is given
+            pattern : regex matched against object keys, only matching files are loaded
+            file_format : file format options of the files
+            copy_options : extra COPY INTO options
+            files_per_copy : files per COPY INTO statement (snowflake allows at most 1000)
+            parallel : number of COPY INTO statements run at once, each on its own connection
+            history_days : days of load history checked for files already loaded (copy_history keeps 14)
+            force : reload files even if load history says they were already loaded
+            
+        Returns:
+            pandas dataframe of the per file COPY INTO results
+        """
+        
+        # aws keys are never written into stage sql, it ends up in error messages and the metrics history
+        if stage == None and storage_integration == None:
+            raise ValueError("copy_from_s3 needs an existing stage or a storage_integration to register one")
+        
+        bucket_name = bucket_name if bucket_name != None else s3.bucket_name
+        folder = prefix[:prefix.rfind("/") + 1]
+        
+        # list candidate files, relative to the stage folder
+        keys = [x for x in s3.multi_file_filter(prefix, bucket_name = bucket_name, aslist = True) if not x.endswith("/")]
+        if pattern != None:
+            keys = [x for x in keys if re.search(pattern, x)]
+        files = [x[len(folder):] for x in keys]
+        record(requests = 1)
+        
+        # register external stage on the folder if none was given, replaced so an older url or integration never sticks
+        if stage == None:
+            
+            stage = f"{table_name}_s3_stage"
+            
+            with self.engine.begin() as con:
+                con.execute(sqlalchemy.text(f"CREATE OR REPLACE STAGE {stage} URL = 's3://{bucket_name}/{folder}' STORAGE_INTEGRATION = {storage_integration}"))
+                record(requests = 1)
+        
+        # skip files the load history already has
+        if force != True and len(files) > 0:
+            
+            with self.engine.connect() as con:
+                loaded = con.execute(sqlalchemy.text(f"""select file_name from table(information_schema.copy_history(
+                                                             table_name => '{table_name}',
+                                                             start_time => dateadd(days, -{int(history_days)}, current_timestamp())))
+                                                         where status = 'Loaded'""")).fetchall()
+                record(requests = 1)
+            
+            loaded = set(x[0] for x in loaded)
+            files = [x for x, key in zip(files, keys) if x not in loaded and key not in loaded and f"s3://{bucket_name}/{key}" not in loaded]
+        
+        if len(files) == 0:
+            print(f"--- No New Files To Load Into {table_name}")
+            return pd.DataFrame()
+        
+        # one COPY INTO per chunk of explicit files, chunks run in parallel
+        def copy(chunk):
+            
+            listed = ", ".join(f"'{x}'" for x in chunk)
+            query = f"""COPY INTO {table_name} FROM @{stage} FILES = ({listed}) FILE_FORMAT = ({file_format}) {copy_options} {"FORCE = TRUE" if force == True else ""}"""
+            
+            with self.engine.begin() as con:
+                result = con.execute(sqlalchemy.text(query))
+                return pd.DataFrame(result.fetchall(), columns = list(result.keys()))
+        
+        chunks = [files[i:i + files_per_copy] for i in range(0, len(files), files_per_copy)]
+        
+        with ThreadPoolExecutor(max_workers = parallel) as pool:
+            results = pd.concat(list(pool.map(copy, chunks)), ignore_index = True)
+        
+        record(requests = len(chunks), rows = int(results["rows_loaded"].sum()) if "rows_loaded" in results.columns else 0)
+        
+        print(f"--- Completed {table_name} Copy Of {len(files)} Files In Snowflake")
+        
+        return results
+        
+    @instrumented
     def append(self, data, table_name, index = False):
         
         """
@@ -107,6 +238,8 @@ class client:
                         con=con,
                         if_exists="append",
                         index=index)
+
+            record(rows = len(data), frame_bytes = int(data.memory_usage(deep = True).sum()), requests = 1)
             
             print(f"--- Completed {table_name} Append In Snowflake")
             
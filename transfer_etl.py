@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This module is intended to stream tables from SQL sources (mssql_etl.client / snowflake_etl.client) straight to parquet on S3.
+
+The transfer runs three overlapping stages connected by bounded queues, so memory stays constant regardless of table size:
+
+    fetch  : cursor batches from the source client's read_batches
+    encode : batches appended as row groups to a streaming parquet writer
+    upload : parquet bytes shipped as S3 multipart upload parts
+"""
+
+import contextvars
+import io
+import queue
+import threading
+from instrumentation import instrumented, record
+from lazy_import import lazy_module
+
+# heavy backends, imported on first use
+pa = lazy_module("pyarrow")
+pq = lazy_module("pyarrow.parquet")
+
+# S3 multipart parts must be at least 5MB, except the last one
+MIN_PART_SIZE = 5 * 1024 ** 2
+
+# marks the end of a queue
+_DONE = object()
+
+
+def _put(q, item, stop):
+
+    """
+    Blocking put that gives up once another stage has failed
+    """
+
+    while not stop.is_set():
+        try:
+            q.put(item, timeout = 0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _get(q, stop):
+
+    """
+    Blocking get that gives up once another stage has failed
+    """
+
+    while not stop.is_set():
+        try:
+            return q.get(timeout = 0.1)
+        except queue.Empty:
+            continue
+
+    return _DONE
+
+
+def _promote_nulls(schema):
+
+    """
+    Replaces null typed fields (columns that were all NULL in the first batch) by strings
+
+    Returns:
+        (promoted schema, names of the promoted columns)
+    """
+
+    promoted = [x.name for x in schema if pa.types.is_null(x.type)]
+
+    return pa.schema([x.with_type(pa.string()) if x.name in promoted else x for x in schema], metadata = schema.metadata), promoted
+
+
+class PartSink:
+
+    def __init__(self, part_size, parts, stop):
+
+        """
+        Write-only file object handed to the parquet writer, cuts the byte stream into upload parts
+
+        Params:
+            part_size: (int) bytes per multipart part
+            parts: (queue) bounded queue receiving part bytes
+            stop: (threading.Event) set when any stage fails
+        """
+
+        self.part_size = part_size
+        self.parts = parts
+        self.stop = stop
+        self.buffer = io.BytesIO()
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+
+        data = bytes(data)
+        self.buffer.write(data)
+        self.position += len(data)
+
+        if self.buffer.tell() >= self.part_size:
+            self._emit()
+
+        return len(data)
+
+    def _emit(self):
+
+        part = self.buffer.getvalue()
+        self.buffer = io.BytesIO()
+
+        if len(part) > 0:
+            _put(self.parts, part, self.stop)
+
+    def tell(self):
+
+        return self.position
+
+    def flush(self):
+
+        pass
+
+    def writable(self):
+
+        return True
+
+    def seekable(self):
+
+        return False
+
+    def close(self):
+
+        # ship the trailing (possibly small) part
+        if not self.closed:
+            self._emit()
+            self.closed = True
+
+
+@instrumented
+def transfer(source_query, dest_s3_path, source, s3, batch_size = 100000, part_size = 64 * 1024 ** 2, queue_size = 4, schema = None, compression = "snappy", feedback = None):
+
+    """
+    Streams the result of a query into one parquet object on S3 without materializing the table
+
+    Params:
+        source_query: (string) query run against the source client
+        dest_s3_path: (string) destination, either s3://bucket/key.parquet or a key within the S3 instance's bucket
+        source: (mssql_etl.client or snowflake_etl.client) client exposing read_batches(query, batch_size)
+        s3: (aws_etl.S3) instantiated S3 helper used for the multipart upload
+        batch_size: (int) rows per fetched batch, also the parquet row group size
+        part_size: (int) bytes per multipart part, at least 5MB
+        queue_size: (int) batches/parts buffered between stages, bounds memory at roughly queue_size * (batch + part)
+        schema: (pyarrow schema) optional fixed schema, defaults to the schema of the first batch with all NULL columns written as text
+        compression: (string) parquet compression codec
+        feedback: (boolean) binary inicator of print feedback, defaulted to True
+
+    Returns:
+        number of rows transferred
+    """
+
+    # resolve destination
+    if dest_s3_path.startswith("s3://"):
+        bucket_name, key = s3.parse_path(dest_s3_path)
+    else:
+        bucket_name, key = s3.bucket_name, dest_s3_path
+
+    part_size = max(part_size, MIN_PART_SIZE)
+    batches = queue.Queue(maxsize = queue_size)
+    parts = queue.Queue(maxsize = queue_size)
+    stop = threading.Event()
+    errors = []
+    etags = []
+
+    def fetch():
+        try:
+            for df in source.read_batches(source_query, batch_size = batch_size):
+                _put(batches, df, stop)
+                if stop.is_set():
+                    break
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(batches, _DONE, stop)
+
+    def upload():
+        try:
+            while True:
+                part = _get(parts, stop)
+                if part is _DONE:
+                    break
+                response = s3.client.upload_part(Bucket = bucket_name, Key = key, UploadId = upload_id,
+                                                  PartNumber = len(etags) + 1, Body = part)
+                etags.append({"PartNumber": len(etags) + 1, "ETag": response["ETag"]})
+                record(bytes = len(part), requests = 1)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    upload_id = s3.client.create_multipart_upload(Bucket = bucket_name, Key = key)["UploadId"]
+    record(requests = 1)
+
+    # worker stages run in copies of this context so they report into the transfer's metrics
+    fetcher = threading.Thread(target = contextvars.copy_context().run, args = (fetch,), daemon = True)
+    uploader = threading.Thread(target = contextvars.copy_context().run, args = (upload,), daemon = True)
+    fetcher.start()
+    uploader.start()
+
+    # encode stage on the calling thread
+    rows = 0
+    sink = PartSink(part_size, parts, stop)
+    writer = None
+    promoted = []
+
+    try:
+
+        while True:
+
+            df = _get(batches, stop)
+            if df is _DONE:
+                break
+
+            # columns typed as text after an all NULL first batch take later numbers/dates as their text
+            if len(promoted) > 0:
+                df = df.assign(**{x: df[x].astype("string") for x in promoted if x in df.columns})
+
+            table = pa.Table.from_pandas(df, schema = schema, preserve_index = False)
+            if writer == None:
+                schema, promoted = _promote_nulls(table.schema)
+                table = table.cast(schema)
+                writer = pq.ParquetWriter(sink, schema, compression = compression)
+
+            writer.write_table(table)
+            rows += len(df)
+
+        # a source yielding no batch at all still produces a valid, column-less parquet file
+        if writer == None and len(errors) == 0:
+            writer = pq.ParquetWriter(sink, schema if schema != None else pa.schema([]), compression = compression)
+
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+
+    finally:
+
+        if writer != None and len(errors) == 0:
+            writer.close()
+        sink.close()
+        _put(parts, _DONE, stop)
+        fetcher.join()
+        uploader.join()
+
+    # finish or roll back the multipart upload
+    if len(errors) > 0:
+        s3.client.abort_multipart_upload(Bucket = bucket_name, Key = key, UploadId = upload_id)
+        raise errors[0]
+
+    s3.client.complete_multipart_upload(Bucket = bucket_name, Key = key, UploadId = upload_id,
+                                        MultipartUpload = {"Parts": etags})
+    record(requests = 1)
+
+    # create optional feedback, default to yes
+    if feedback != False:
+        print(f"Successfuly Transferred {rows} rows within bucket {bucket_name} to {key}")
+
+    return rows